@@ -0,0 +1,129 @@
+import os
+import re
+import hashlib
+import logging
+import itertools
+
+import state
+
+ACCOUNT_SECTION = 'account '
+TOKEN_ASSIGNMENTS = ('owner', 'round_robin')
+GITHUB_OWNER = re.compile(r'github\.com[/:]([^/]+)/')
+
+def split_list(value):
+    """Split a comma-separated setting into its non-empty items."""
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+def make_account(name, section):
+    """Build an account from a config section."""
+    username = section['github_username']
+    return {
+        'name': name,
+        'username': username,
+        'token': section['github_token'],
+        'owners': {owner.lower() for owner in [username] + split_list(section.get('owners'))},
+        'roots': [os.path.abspath(os.path.expanduser(root)) for root in split_list(section.get('roots'))],
+    }
+
+def load_accounts(config):
+    """Return the configured GitHub accounts: the [DEFAULT] credentials first, then every [account <name>] section.
+
+    Account sections take github_username and github_token, plus optional owners (other
+    users or organisations whose repositories the account should serve) and roots
+    (project directories whose projects it serves by default).
+    """
+    accounts = [make_account('default', config)]
+    for section in config.parser.sections():
+        if section.startswith(ACCOUNT_SECTION):
+            accounts.append(make_account(section[len(ACCOUNT_SECTION):].strip(), own_options(config.parser, section)))
+    return accounts
+
+def own_options(parser, section):
+    """Return the options set in a section itself, without those configparser inherits from [DEFAULT].
+
+    An account section missing its token must fail rather than silently use the default account's.
+    """
+    options = {key: parser[section][key] for key in parser._sections[section]}
+    for key in ('github_username', 'github_token'):
+        if key not in options:
+            raise KeyError(f"{key} is missing from [{section}]")
+    return options
+
+def project_roots(config, accounts):
+    """Return every directory holding projects: the projects_dir list followed by the roots of the accounts."""
+    roots = [os.path.abspath(os.path.expanduser(root)) for root in split_list(config['projects_dir'])]
+    for account in accounts:
+        roots.extend(root for root in account['roots'] if root not in roots)
+    return roots
+
+def list_projects(roots):
+    """Return the path of every entry in the project roots."""
+    return [os.path.join(root, project) for root in roots for project in sorted(os.listdir(root))]
+
+def resolve_projects(roots, names):
+    """Return the paths of projects named on the command line, looked up in the roots in order."""
+    paths = []
+    for name in names:
+        matches = [os.path.join(root, name) for root in roots if os.path.exists(os.path.join(root, name))]
+        # A missing project keeps a path under the first root, so it is reported as skipped
+        paths.append(matches[0] if matches else os.path.join(roots[0], name))
+    return paths
+
+def parse_shard(value):
+    """Parse an 'i/N' shard specification into (i, N), with 0 <= i < N, or return None if value is empty."""
+    if not value:
+        return None
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', value)
+    if not match or int(match[2]) == 0 or int(match[1]) >= int(match[2]):
+        raise ValueError(f"Invalid shard {value!r}, expected i/N with 0 <= i < N")
+    return int(match[1]), int(match[2])
+
+def in_shard(project_path, shard):
+    """Check whether a project belongs to a shard.
+
+    The hash is taken over the project's directory name, not its absolute path, so hosts
+    that mount the projects tree in different places still agree on the split.
+    """
+    if shard is None:
+        return True
+    index, count = shard
+    digest = hashlib.sha1(os.path.basename(os.path.normpath(project_path)).encode()).hexdigest()
+    return int(digest, 16) % count == index
+
+def remote_owner(project_path):
+    """Return the GitHub owner of a project's origin, from the state store or the repository, or None."""
+    remote_url = (state.load_project(project_path, read_only=True) or {}).get('remote_url')
+    if not remote_url:
+        from git import Repo
+        try:
+            with Repo(project_path) as repo:
+                remote_url = repo.remotes.origin.url if 'origin' in repo.remotes else None
+        except Exception:
+            return None
+    match = GITHUB_OWNER.search(remote_url or '')
+    return match[1].lower() if match else None
+
+def make_assigner(accounts, mode='owner'):
+    """Return a function mapping a project path to the account whose token serves it.
+
+    A project whose origin belongs to an owner of an account uses that account, then a
+    project under one of an account's roots uses that account. The rest use the [DEFAULT]
+    account, or with mode 'round_robin' take turns over all accounts to spread the rate limit.
+    """
+    if mode not in TOKEN_ASSIGNMENTS:
+        raise ValueError(f"Unknown token_assignment {mode}, expected one of {', '.join(TOKEN_ASSIGNMENTS)}")
+    rotation = itertools.cycle(accounts)
+
+    def assign(project_path):
+        owner = remote_owner(project_path) if len(accounts) > 1 else None
+        for account in accounts:
+            if owner and owner in account['owners']:
+                return account
+        for account in accounts:
+            if any(os.path.abspath(project_path).startswith(root + os.sep) for root in account['roots']):
+                return account
+        account = next(rotation) if mode == 'round_robin' else accounts[0]
+        logging.debug("Assigned %s to GitHub account %s.", project_path, account['name'])
+        return account
+
+    return assign
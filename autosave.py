@@ -1,104 +1,367 @@
-import datetime
 import os
+import shutil
+import collections
+import datetime
 import logging
-from git import Repo, GitCommandError
+import tempfile
+from git import GitCommandError
 
-from utils import generate_ai_message
+import metrics
+import state
+import throttle
+import git_backend
+import retention
+from utils import get_setting, read_json_file, write_json_atomic
+from commit_messages import generate_ai_message
+from change_detection import get_changes, get_threshold, record_autosave, load_snapshot, git_status
+from snapshot_policy import stage_snapshot, discard_held_back
+
+ANCESTOR_CACHE_FILE = 'autosave_ancestor.json'
 
 # bypass_check is used to bypass the check for changes and run the autosave anyway
 def autosave(project_path, openai_key, bypass_check=False):
     """Autosave the project to the remote repository"""
-    logging.info(f"Starting autosave for project: {project_path}")
+    logging.info("Starting autosave for project: %s", project_path)
 
-    try:
-        repo = Repo(project_path)
-        current_branch = repo.active_branch
-        current_branch_name = current_branch.name
-        now = datetime.datetime.now()
-
-        # Decide if an autosave is necessary
-        changes = get_changes(repo, now)
-        if not changes and not bypass_check:
-            logging.info("No local changes older than 24 hours.")
-            return
+    with git_backend.session(project_path):
+        try:
+            repo = git_backend.open_repo(project_path)
+            current_branch = repo.active_branch
+            now = datetime.datetime.now()
 
-        # Stash changes before switching branches
-        repo.git.stash('--include-untracked')
+            # Decide if an autosave is necessary
+            with metrics.span('detect_changes'):
+                changes = get_changes(repo, now)
+            metrics.incr('files_changed', len(changes))
+            if not changes and not bypass_check:
+                logging.info("No unsaved local changes older than %s.", get_threshold())
+                return
+            throttle.wait_until_idle(repo)
 
-        # Push up any untracked branches besides the current branch
-        push_untracked_branches(repo, current_branch_name)
+            # Skip the commit, the commit message and the push if nothing changed since the last autosave
+            with metrics.span('snapshot'):
+                tree = write_snapshot_tree(repo)
+            if tree == load_snapshot(repo).get('tree'):
+                logging.info("Working tree is unchanged since the last autosave (tree %s), skipping.", tree)
+                metrics.incr('autosaves_deduplicated')
+                record_autosave(repo, tree)
+                return
 
+            throttle.check_deadline("autosaving")
+            if get_setting('autosave_mode', 'stash') == 'snapshot':
+                snapshot_autosave(repo, current_branch, openai_key, now, tree)
+            else:
+                stash_autosave(repo, current_branch, openai_key, now, tree)
+            retention.prune_autosave_branches(repo, now)
+        except GitCommandError as e:
+            logging.error("Git command error during autosave for project %s: %s", project_path, e)
+        except Exception as e:
+            logging.error("Unexpected error during autosave for project %s: %s", project_path, e)
+
+def stash_autosave(repo, current_branch, openai_key, now, snapshot_tree):
+    """Autosave by stashing the changes and applying them on top of the common ancestor, checked out detached.
+
+    snapshot_tree is the tree of the working tree as a whole, recorded to recognise it next time.
+    """
+    current_branch_name = current_branch.name
+    autosaved_tree = None
+    autosave_branch_name = None
+
+    # Stash changes before switching branches; a clean tree creates no entry, and the user's own stashes must not be touched
+    with metrics.span('stash'):
+        stash_before = stash_tip(repo)
+        repo.git.stash('--include-untracked')
+        stashed = stash_tip(repo) != stash_before
+    try:
         # Find the branch to branch off of
-        common_ancestor = find_common_ancestor(repo, current_branch)
+        with metrics.span('find_ancestor'):
+            common_ancestor = find_common_ancestor(repo, current_branch)
         if not common_ancestor:
             logging.error("No common ancestor found with any remote branch.")
             return
 
-        # Push the current branch to the remote repository
-        repo.remotes.origin.push(current_branch_name)
+        # Publish any untracked branches and the current branch along with the autosave branch
+        new_branches = untracked_branches(repo, current_branch_name)
+        branches_to_push = new_branches + [current_branch_name]
 
-        # Create the autosave branch, add and commit the changes, and push the autosave branch to the remote repository
-        autosave_branch_name = create_autosave_branch(repo, current_branch_name, common_ancestor, now)
-        
-        # Apply the stashed changes to the new autosave branch
-        try:
-            repo.git.stash('apply')
-        except GitCommandError as e:
-            logging.error(f"Git command error during stash apply: {e}")
-
-        if repo.is_dirty(untracked_files=True):
-            repo.git.add(A=True)
-            commit_message = generate_ai_message(repo.git.diff('HEAD', '--staged'), openai_key)
-            repo.index.commit(commit_message)
-            repo.remotes.origin.push(autosave_branch_name)
-        logging.info(f"Autosaved changes to branch {autosave_branch_name} for project {project_path}")
-    except GitCommandError as e:
-        logging.error(f"Git command error during autosave for project {project_path}: {e}")
-    except Exception as e:
-        logging.error(f"Unexpected error during autosave for project {project_path}: {e}")
+        # Check out the ancestor, add and commit the changes, and push them to the remote repository as an autosave branch
+        with metrics.span('checkout'):
+            repo.git.checkout('--detach', common_ancestor.hexsha)
+
+        # Apply the stashed changes on top of the ancestor
+        if stashed:
+            with metrics.span('stash'):
+                try:
+                    repo.git.stash('apply')
+                except GitCommandError as e:
+                    logging.error("Git command error during stash apply: %s", e)
+
+        status = git_status(repo)
+        if status:
+            with metrics.span('commit'):
+                held_back = stage_snapshot(repo, status=status)
+                diff = message_diff(repo, 'HEAD', '--staged')
+                tree = repo.git.write_tree()
+            commit_message = generate_ai_message(diff, openai_key, tree)
+            with metrics.span('commit'):
+                autosave_branch_name = commit_autosave(repo, tree, common_ancestor, current_branch_name, commit_message, now)
+                # Move the detached HEAD onto the commit, so switching back leaves nothing staged behind
+                repo.git.update_ref('--no-deref', 'HEAD', f'refs/heads/{autosave_branch_name}')
+                autosaved_tree = tree
+                discard_held_back(repo, held_back)
+            branches_to_push.append(autosave_branch_name)
+        results = push_branches(repo, branches_to_push, track=new_branches)
+        if autosaved_tree and not was_pushed(results, autosave_branch_name):
+            autosaved_tree = None
+            raise GitCommandError(['git', 'push'], 1, f"Push of {autosave_branch_name} was rejected")
+        if autosave_branch_name:
+            logging.info("Autosaved changes to branch %s for project %s", autosave_branch_name, repo.working_dir)
     finally:
-        repo.git.checkout(current_branch_name)
-        try:
-            repo.git.stash('pop')
-        except GitCommandError as e:
-            logging.error(f"Git command error during stash pop: {e}")
+        with metrics.span('checkout'):
+            repo.git.checkout(current_branch_name)
+        if stashed:
+            with metrics.span('stash'):
+                try:
+                    repo.git.stash('pop')
+                except GitCommandError as e:
+                    logging.error("Git command error during stash pop: %s", e)
+        if autosaved_tree:
+            record_autosave(repo, snapshot_tree)
+            state.save_project(repo.working_dir, last_autosave=now.isoformat())
+
+def stash_tip(repo):
+    """Return the commit of the newest stash entry, or '' if there is none."""
+    return repo.git.rev_parse('--verify', '--quiet', 'refs/stash', with_exceptions=False)
+
+def snapshot_autosave(repo, current_branch, openai_key, now, tree):
+    """Autosave without touching the working tree or the user's index.
+
+    The snapshot tree, written by write_snapshot_tree with a private index, is committed on top
+    of the common ancestor with commit-tree and published as a new branch, so it is safe while
+    files are being edited.
+    """
+    current_branch_name = current_branch.name
+
+    # Find the commit to base the snapshot on
+    with metrics.span('find_ancestor'):
+        common_ancestor = find_common_ancestor(repo, current_branch)
+    if not common_ancestor:
+        logging.error("No common ancestor found with any remote branch.")
+        return
+
+    # Publish any untracked branches and the current branch along with the autosave branch
+    new_branches = untracked_branches(repo, current_branch_name)
+    branches_to_push = new_branches + [current_branch_name]
 
-def get_changes(repo, now):
-    changes = []
-    for item in repo.index.diff(None):
-        path = os.path.join(repo.working_dir, item.a_path)
-        change_time = datetime.datetime.fromtimestamp(os.path.getmtime(path))
-        if (now - change_time).days >= 1:
-            changes.append(item.a_path)
-    return changes
+    if tree == common_ancestor.tree.hexsha:
+        logging.info("Working tree matches %s, nothing to autosave.", common_ancestor.hexsha)
+        push_branches(repo, branches_to_push, track=new_branches)
+        return
+
+    with metrics.span('commit'):
+        diff = message_diff(repo, common_ancestor.hexsha, tree)
+    commit_message = generate_ai_message(diff, openai_key, tree)
+    with metrics.span('commit'):
+        autosave_branch_name = commit_autosave(repo, tree, common_ancestor, current_branch_name, commit_message, now)
+    results = push_branches(repo, branches_to_push + [autosave_branch_name], track=new_branches)
+    if not was_pushed(results, autosave_branch_name):
+        raise GitCommandError(['git', 'push'], 1, f"Push of {autosave_branch_name} was rejected")
+    record_autosave(repo, tree)
+    state.save_project(repo.working_dir, last_autosave=now.isoformat())
+    logging.info("Autosaved changes to branch %s for project %s", autosave_branch_name, repo.working_dir)
+
+def write_snapshot_tree(repo):
+    """Write the working tree, untracked files included, as a tree object and return its hash.
+
+    A copy of the real index is used so unchanged files are recognised from their cached
+    stat data and only changed files are hashed, while the user's index stays untouched.
+    Files held back by the snapshot policy are left out and listed in a manifest instead.
+    """
+    fd, index_path = tempfile.mkstemp(dir=repo.git_dir, prefix='autosave_index_')
+    os.close(fd)
+    try:
+        real_index = os.path.join(repo.git_dir, 'index')
+        if os.path.exists(real_index):
+            shutil.copyfile(real_index, index_path)
+        else:
+            os.remove(index_path)
+        env = {'GIT_INDEX_FILE': index_path}
+        stage_snapshot(repo, env=env)
+        return repo.git.write_tree(env=env)
+    finally:
+        if os.path.exists(index_path):
+            os.remove(index_path)
+
+def message_diff(repo, *args):
+    """Return the diff the commit message is generated from.
+
+    Binary files are reported by name only and no textconv or external diff driver is
+    run, so the cost of the diff follows the size of the source changes.
+    """
+    return repo.git.diff('--no-textconv', '--no-ext-diff', *args)
 
 def find_common_ancestor(repo, current_branch):
-    remote_branches = repo.remotes.origin.refs
-    for remote_branch in remote_branches:
-        try:
-            return repo.merge_base(current_branch, remote_branch)[0]
-        except IndexError:
-            continue
+    """Return the closest commit the current branch shares with origin, or None.
+
+    The upstream branch is preferred, then origin's default branch, then any other remote
+    branch; autosave branches are never used. The result is cached per HEAD and remote tips.
+    """
+    session = git_backend.session_for(repo)
+    head = current_branch.commit.hexsha
+    tips = {ref: sha for ref, sha in session.remote_tips().items() if '_autosave_' not in ref}
+    cache_path = os.path.join(repo.git_dir, ANCESTOR_CACHE_FILE)
+    cached = read_json_file(cache_path) or {}
+    if cached.get('head') == head and cached.get('tips') == tips:
+        return repo.commit(cached['ancestor']) if cached['ancestor'] else None
+
+    upstream = session.branches().get(current_branch.name, {}).get('upstream')
+    default = session.refs().get('refs/remotes/origin/HEAD', {}).get('symref')
+    preferred = [ref for ref in (upstream, default) if ref in tips]
+    ancestor = None
+    for refs in [[ref] for ref in preferred] + [[ref for ref in tips if ref not in preferred]]:
+        if refs:
+            ancestor = closest_merge_base(repo, head, [tips[ref] for ref in refs])
+        if ancestor:
+            break
+    write_json_atomic(cache_path, {'head': head, 'tips': tips, 'ancestor': ancestor})
+    return repo.commit(ancestor) if ancestor else None
+
+def closest_merge_base(repo, head, tips):
+    """Return the common ancestor of head and any of tips that is the fewest commits away from head.
+
+    One rev-list lists the commits only head has, with their parents; the boundary commits
+    are the common ancestors where it stops, and a breadth-first walk from head finds the nearest.
+    """
+    output = repo.git.rev_list('--boundary', '--parents', head, '--not', *tips)
+    if not output:
+        # head is already on one of the tips
+        return head
+    parents = {}
+    boundary = set()
+    for line in output.splitlines():
+        if line.startswith('-'):
+            boundary.add(line[1:].split()[0])
+        else:
+            sha, *commit_parents = line.split()
+            parents[sha] = commit_parents
+    queue = collections.deque([head])
+    seen = {head}
+    while queue:
+        sha = queue.popleft()
+        if sha in boundary:
+            return sha
+        for parent in parents.get(sha, ()):
+            if parent not in seen:
+                seen.add(parent)
+                queue.append(parent)
     return None
 
-def create_autosave_branch(repo, current_branch_name, common_ancestor, now):
-    increment = 0
-    base_autosave_branch_name = f"{current_branch_name}_{now.strftime('%Y%m%d')}_autosave_{increment}"
-    autosave_branch_name = base_autosave_branch_name
+def commit_autosave(repo, tree, common_ancestor, current_branch_name, message, now):
+    """Commit an autosaved tree to a new autosave branch and return the branch name.
 
-    # Check if the branch already exists and increment the name if necessary
-    while autosave_branch_name in repo.branches:
+    With autosave_collapse_daily, all autosaves of a branch on one day go to a single branch
+    instead, each committed on top of the previous one so that pushing it fast-forwards.
+    """
+    parent = common_ancestor.hexsha
+    if get_setting('autosave_collapse_daily', False, bool):
+        autosave_branch_name = f"{current_branch_name}_{now.strftime('%Y%m%d')}_autosave_0"
+        refs = git_backend.session_for(repo).refs()
+        previous = refs.get(f'refs/heads/{autosave_branch_name}') or refs.get(f'refs/remotes/origin/{autosave_branch_name}')
+        if previous:
+            parent = previous['sha']
+    else:
+        autosave_branch_name = next_autosave_branch_name(repo, current_branch_name, now)
+    commit = repo.git.commit_tree(tree, '-p', parent, '-m', message)
+    repo.git.update_ref(f'refs/heads/{autosave_branch_name}', commit)
+    git_backend.invalidate(repo)
+    return autosave_branch_name
+
+def next_autosave_branch_name(repo, current_branch_name, now):
+    """Return the next free autosave branch name for today.
+
+    The last number used is kept in the state store, so the name is found without scanning
+    the branches; existing refs are only checked to step over names taken by other clones.
+    """
+    prefix = f"{current_branch_name}_{now.strftime('%Y%m%d')}_autosave_"
+    counters = (state.load_project(repo.working_dir) or {}).get('autosave_counters') or {}
+    increment = counters[prefix] + 1 if prefix in counters else 0
+    refs = git_backend.session_for(repo).refs()
+
+    def name(increment):
+        return f"{prefix}0" if increment == 0 else f"{prefix}0_{increment}"
+
+    while f'refs/heads/{name(increment)}' in refs or f'refs/remotes/origin/{name(increment)}' in refs:
         increment += 1
-        autosave_branch_name = f"{base_autosave_branch_name}_{increment}"
+    # Only today's counters can be used again, so older ones are dropped
+    state.save_project(repo.working_dir, autosave_counters={prefix: increment})
+    return name(increment)
 
-    repo.git.checkout(common_ancestor)
-    repo.git.checkout('-b', autosave_branch_name)
-    return autosave_branch_name
+def untracked_branches(repo, current_branch_name):
+    # Local branches without an upstream besides the current branch (ignore branches with autosave in the name)
+    return [name for name, branch in git_backend.session_for(repo).branches().items()
+            if branch['upstream'] is None and name != current_branch_name and "autosave" not in name]
+
+def push_branches(repo, branch_names, track=()):
+    """Push several branches to origin in a single git push and return the per-ref results.
+
+    The push is atomic where the remote supports it. If an atomic push is rejected, the refs
+    are pushed again without --atomic so that one rejected branch (for example a diverged
+    current branch) does not hold back the others. Results map each remote ref name to a
+    (flag, summary) pair from the porcelain output, where flag '!' means rejected.
+
+    Only the branches in track, which had no upstream, are set to track origin once accepted;
+    the upstreams of the others, and of autosave branches, are left as they are.
+    """
+    throttle.check_deadline("pushing")
+    refspecs = [f"refs/heads/{name}:refs/heads/{name}" for name in branch_names]
+    atomic = get_setting('push_atomic', True, bool)
+    metrics.incr('bytes_pushed', estimate_push_size(repo, branch_names))
+    with metrics.span('push'):
+        status, results, stderr = _push(repo, refspecs, atomic)
+        if status != 0 and atomic:
+            if 'atomic' in stderr and 'support' in stderr:
+                logging.debug("Remote does not support atomic pushes, pushing refs individually.")
+            else:
+                logging.debug("Atomic push rejected, retrying without --atomic: %s", stderr)
+            status, results, stderr = _push(repo, refspecs, False)
+        for name in track:
+            if was_pushed(results, name):
+                repo.git.branch('--set-upstream-to', f'origin/{name}', name)
+        git_backend.invalidate(repo)
+    metrics.incr('refs_pushed', sum(1 for flag, _ in results.values() if flag not in ('!', '=')))
+
+    for ref, (flag, summary) in results.items():
+        if flag == '!':
+            logging.error("Push of %s was rejected: %s", ref, summary)
+        else:
+            logging.debug("Pushed %s: %s", ref, summary)
+    if status != 0 and not results:
+        raise GitCommandError(['git', 'push'], status, stderr)
+    return results
+
+def estimate_push_size(repo, branch_names):
+    """Estimate the bytes a push will send: the on-disk size of objects not yet on any origin ref."""
+    try:
+        return int(repo.git.rev_list('--objects', '--disk-usage', *[f'refs/heads/{name}' for name in branch_names], '--not', '--remotes=origin'))
+    except (GitCommandError, ValueError):
+        return 0
+
+def was_pushed(results, branch_name):
+    """Check whether push_branches reported a branch as accepted by the remote."""
+    flag = results.get(f'refs/heads/{branch_name}', ('!', ''))[0]
+    return flag != '!'
 
-def push_untracked_branches(repo, current_branch_name):
-    # Push up any untracked branches besides the current branch (ignore branches with autosave in the name)
-    for branch in repo.branches:
-        if branch.tracking_branch() is None and branch.name != current_branch_name and "autosave" not in branch.name:
-            repo.git.checkout(branch)
-            repo.remotes.origin.push(branch)
-    repo.git.checkout(current_branch_name)
\ No newline at end of file
+def _push(repo, refspecs, atomic):
+    args = ['--porcelain'] + (['--atomic'] if atomic else []) + ['origin'] + refspecs
+    limited = throttle.limit_upload([repo.git.GIT_PYTHON_GIT_EXECUTABLE, 'push'] + args)
+    if limited:
+        status, stdout, stderr = repo.git.execute(limited, with_extended_output=True, with_exceptions=False)
+    else:
+        status, stdout, stderr = repo.git.push(*args, with_extended_output=True, with_exceptions=False)
+    results = {}
+    for line in stdout.splitlines():
+        # Porcelain lines are "<flag>\t<from>:<to>\t<summary>"
+        fields = line.split('\t')
+        if len(fields) == 3 and ':' in fields[1]:
+            results[fields[1].split(':', 1)[1]] = (fields[0], fields[2])
+    return status, results, stderr
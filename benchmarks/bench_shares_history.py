@@ -0,0 +1,91 @@
+"""Compare the old rev-list set intersection with the merge-base history check.
+
+Usage: python benchmarks/bench_shares_history.py [--commits N] [--branches B]
+
+Builds a synthetic repository with a long linear history and several remote branches
+forked from it, then times both approaches and prints the results as JSON.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from git import Repo
+
+from git_operations import shares_history
+
+def data(text):
+    return f"data {len(text.encode())}\n{text}\n"
+
+def build_history(path, commits, branches, commit_graph=False):
+    """Create a repository with a linear history on main and branches forked along it, using fast-import."""
+    subprocess.run(['git', 'init', '-q', '-b', 'main', path], check=True)
+    lines = []
+    for index in range(1, commits + 1):
+        lines.append(f"commit refs/heads/main\nmark :{index}\ncommitter Bench <bench@example.com> {1600000000 + index} +0000\n{data(f'commit {index}')}")
+        if index > 1:
+            lines.append(f"from :{index - 1}\n")
+        lines.append(f"M 644 inline file.txt\n{data(str(index))}")
+    for branch in range(branches):
+        fork_point = max(1, commits * (branch + 1) // (branches + 1))
+        lines.append(f"commit refs/remotes/origin/branch_{branch}\ncommitter Bench <bench@example.com> {1700000000 + branch} +0000\n{data(f'branch {branch}')}from :{fork_point}\n")
+    subprocess.run(['git', 'fast-import', '--quiet'], cwd=path, input=''.join(lines).encode(), check=True)
+    subprocess.run(['git', 'checkout', '-q', 'main'], cwd=path, check=True)
+    if commit_graph:
+        subprocess.run(['git', 'commit-graph', 'write', '--reachable'], cwd=path, check=True)
+
+def rev_list_intersection(repo, remote_refs):
+    # The approach previously used by match_local_repo_to_remote_repo
+    for ref in remote_refs:
+        remote_commits = set(repo.git.rev_list(ref).split())
+        local_commits = set(repo.git.rev_list('HEAD').split())
+        if remote_commits & local_commits:
+            return True
+    return False
+
+def merge_base_check(repo, remote_refs):
+    head_sha = repo.head.commit.hexsha
+    for remote_sha in {repo.commit(ref).hexsha for ref in remote_refs}:
+        if shares_history(repo, head_sha, remote_sha):
+            return True
+    return False
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--commits', type=int, default=50000)
+    parser.add_argument('--branches', type=int, default=10)
+    parser.add_argument('--commit-graph', action='store_true', help="Write a commit-graph file, as fetch.writeCommitGraph would")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        build_history(path, args.commits, args.branches, args.commit_graph)
+        repo = Repo(path)
+        remote_refs = [f"origin/branch_{branch}" for branch in range(args.branches)]
+
+        old_result, old_time = timed(rev_list_intersection, repo, remote_refs)
+        new_result, new_time = timed(merge_base_check, repo, remote_refs)
+        cached_result, cached_time = timed(merge_base_check, repo, remote_refs)
+        assert old_result == new_result == cached_result
+
+    print(json.dumps({
+        'commits': args.commits,
+        'branches': args.branches,
+        'commit_graph': args.commit_graph,
+        'rev_list_seconds': round(old_time, 4),
+        'merge_base_seconds': round(new_time, 4),
+        'merge_base_cached_seconds': round(cached_time, 4),
+        'speedup': round(old_time / new_time, 1) if new_time else None,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Generate a synthetic farm of projects backed by local bare remotes.
+
+Layout under the farm root:
+    remotes/<owner>/<name>.git   bare repositories standing in for GitHub
+    projects/<name>              working copies and plain directories to autosave
+    gitconfig                    git config for the run: identity, and an insteadOf rule
+                                 sending https://github.com/ to remotes/
+"""
+import os
+import time
+import random
+import subprocess
+from dataclasses import dataclass
+
+@dataclass
+class FarmSpec:
+    repos: int = 10
+    plain_dirs: int = 2
+    history_depth: int = 200
+    branches: int = 3
+    local_branches: int = 1
+    files: int = 50
+    file_size: int = 2048
+    modified_files: int = 5
+    untracked_files: int = 5
+    binary_size: int = 0
+    unsaved_age_hours: float = 48
+    owner: str = 'bench'
+    seed: int = 0
+
+def data(content):
+    return b"data %d\n" % len(content) + content + b"\n"
+
+def git(path, *args, env=None):
+    subprocess.run(['git', *args], cwd=path, check=True, env=env, stdout=subprocess.DEVNULL)
+
+def write_file(path, size, rng):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(rng.randbytes(size // 2).hex().encode()[:size])
+
+def age(path, hours):
+    timestamp = time.time() - hours * 3600
+    os.utime(path, (timestamp, timestamp))
+
+def build_history(path, spec, rng):
+    """Fill a new repository with history_depth commits on main, each touching one file, using fast-import."""
+    stream = []
+    for index in range(1, spec.history_depth + 1):
+        stream.append(b"commit refs/heads/main\nmark :%d\n" % index)
+        stream.append(b"committer Bench <bench@example.com> %d +0000\n" % (1600000000 + index * 60))
+        stream.append(data(b"Commit %d" % index))
+        if index > 1:
+            stream.append(b"from :%d\n" % (index - 1))
+        if index == 1:
+            touched = range(spec.files)
+        else:
+            touched = [rng.randrange(spec.files)]
+        for file_index in touched:
+            content = rng.randbytes(spec.file_size // 2).hex().encode()[:spec.file_size]
+            stream.append(b"M 644 inline src/file_%04d.txt\n" % file_index + data(content))
+    for branch in range(spec.branches):
+        fork_point = rng.randint(1, spec.history_depth)
+        stream.append(b"reset refs/heads/branch_%d\nfrom :%d\n\n" % (branch, fork_point))
+    subprocess.run(['git', 'fast-import', '--quiet'], cwd=path, input=b''.join(stream), check=True)
+
+def create_farm(root, spec=None):
+    """Create the farm described by spec under root and return the paths of its parts."""
+    spec = spec or FarmSpec()
+    rng = random.Random(spec.seed)
+    remotes_dir = os.path.join(root, 'remotes')
+    projects_dir = os.path.join(root, 'projects')
+    os.makedirs(os.path.join(remotes_dir, spec.owner))
+    os.makedirs(projects_dir)
+
+    gitconfig = os.path.join(root, 'gitconfig')
+    with open(gitconfig, 'w') as f:
+        f.write("[user]\n\tname = Bench\n\temail = bench@example.com\n")
+        f.write("[init]\n\tdefaultBranch = main\n")
+        f.write("[push]\n\tautoSetupRemote = true\n")
+        f.write(f"[url \"file://{remotes_dir}/\"]\n\tinsteadOf = https://github.com/\n")
+        f.write("[uploadpack]\n\tallowFilter = true\n")
+    env = dict(os.environ, GIT_CONFIG_GLOBAL=gitconfig, GIT_CONFIG_NOSYSTEM='1')
+
+    for index in range(spec.repos):
+        name = f"project_{index:04d}"
+        project = os.path.join(projects_dir, name)
+        git(projects_dir, 'init', '--quiet', '-b', 'main', name, env=env)
+        build_history(project, spec, rng)
+        git(project, 'reset', '--quiet', '--hard', 'main', env=env)
+        remote = os.path.join(remotes_dir, spec.owner, f"{name}.git")
+        git(root, 'init', '--quiet', '--bare', remote, env=env)
+        git(project, 'remote', 'add', 'origin', f"https://github.com/{spec.owner}/{name}.git", env=env)
+        git(project, 'push', '--quiet', '-u', 'origin', 'main', *[f"branch_{branch}" for branch in range(spec.branches)], env=env)
+        for branch in range(spec.local_branches):
+            git(project, 'branch', f"local_{branch}", env=env)
+
+        for file_index in rng.sample(range(spec.files), min(spec.modified_files, spec.files)):
+            path = os.path.join(project, 'src', f"file_{file_index:04d}.txt")
+            write_file(path, spec.file_size, rng)
+            age(path, spec.unsaved_age_hours)
+        for file_index in range(spec.untracked_files):
+            path = os.path.join(project, 'notes', f"untracked_{file_index:04d}.txt")
+            write_file(path, spec.file_size, rng)
+            age(path, spec.unsaved_age_hours)
+        if spec.binary_size:
+            path = os.path.join(project, 'data', 'dataset.bin')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(rng.randbytes(spec.binary_size))
+            age(path, spec.unsaved_age_hours)
+
+    for index in range(spec.plain_dirs):
+        directory = os.path.join(projects_dir, f"plain_{index:04d}")
+        for file_index in range(min(spec.files, 10)):
+            write_file(os.path.join(directory, f"file_{file_index:04d}.txt"), spec.file_size, rng)
+
+    return {'root': root, 'remotes_dir': remotes_dir, 'projects_dir': projects_dir, 'gitconfig': gitconfig, 'env': env}
@@ -0,0 +1,159 @@
+"""End-to-end benchmarks of the autosave pipeline on a synthetic project farm.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--repos N] [--history-depth N] ... [--output results.json]
+    python benchmarks/run_benchmarks.py --baseline baseline.json [--tolerance 0.2]
+
+A farm of repositories with local bare remotes and a stub GitHub API is generated in a
+temporary directory, then main.process_project, autosave.autosave and the helpers they use
+are timed on every project. Results are printed as JSON; with --baseline, timings are
+compared against an earlier result and the exit status is 1 if any regressed by more than
+the tolerance.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+import tempfile
+import statistics
+import dataclasses
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from farm import FarmSpec, create_farm
+from stub_github import StubGitHubServer
+
+def write_config(path, farm, server, spec, settings):
+    with open(path, 'w') as f:
+        f.write("[DEFAULT]\n")
+        f.write(f"projects_dir={farm['projects_dir']}\n")
+        f.write(f"github_username={spec.owner}\n")
+        f.write("github_token=bench_token\n")
+        f.write("openai_key=\n")
+        f.write(f"github_api_url={server.url}\n")
+        f.write(f"cache_dir={os.path.join(farm['root'], 'cache')}\n")
+        f.write(f"metrics_dir={os.path.join(farm['root'], 'logs')}\n")
+        for key, value in settings.items():
+            f.write(f"{key}={value}\n")
+
+class Timings:
+    def __init__(self, server):
+        self.server = server
+        self.samples = {}
+        self.api_calls = {}
+
+    def measure(self, name, func, *args, **kwargs):
+        calls = self.server.calls
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        self.api_calls[name] = self.api_calls.get(name, 0) + self.server.calls - calls
+        return result
+
+    def summary(self):
+        return {name: {
+            'count': len(samples),
+            'total': round(sum(samples), 4),
+            'mean': round(statistics.mean(samples), 4),
+            'median': round(statistics.median(samples), 4),
+            'max': round(max(samples), 4),
+            'api_calls': self.api_calls[name],
+        } for name, samples in self.samples.items()}
+
+def run(spec, settings=None):
+    with tempfile.TemporaryDirectory(prefix='autosave_bench_') as root:
+        start = time.perf_counter()
+        farm = create_farm(root, spec)
+        farm_seconds = time.perf_counter() - start
+        server = StubGitHubServer(farm['remotes_dir'], spec.owner).start()
+        config_file = os.path.join(root, 'autosave_config.txt')
+        write_config(config_file, farm, server, spec, settings or {})
+        os.environ.update({
+            'GITHUB_AUTOSAVE_CONFIG_FILE': config_file,
+            'GIT_CONFIG_GLOBAL': farm['gitconfig'],
+            'GIT_CONFIG_NOSYSTEM': '1',
+        })
+
+        # Imported late so they pick up the farm's config file
+        from git import Repo
+        import main
+        import autosave
+        import git_operations
+        from change_detection import get_changes
+        from fetch_strategy import fetch_origin
+        logging.getLogger().setLevel(logging.WARNING)
+
+        timings = Timings(server)
+        projects = sorted(os.listdir(farm['projects_dir']))
+        repos = [os.path.join(farm['projects_dir'], project) for project in projects if project.startswith('project_')]
+        plain_dirs = [os.path.join(farm['projects_dir'], project) for project in projects if project.startswith('plain_')]
+        now = datetime.datetime.now()
+
+        for path in repos:
+            repo = Repo(path)
+            timings.measure('is_git_repo', git_operations.is_git_repo, path)
+            timings.measure('get_changes', get_changes, repo, now)
+            timings.measure('fetch_origin', fetch_origin, repo)
+            timings.measure('find_common_ancestor', autosave.find_common_ancestor, repo, repo.active_branch)
+            timings.measure('write_snapshot_tree', autosave.write_snapshot_tree, repo)
+            timings.measure('match_local_repo_to_remote_repo', git_operations.match_local_repo_to_remote_repo, path, spec.owner, 'bench_token')
+
+        for path in repos + plain_dirs:
+            timings.measure('process_project_cold', main.process_project, path, spec.owner, 'bench_token', '')
+        for path in repos + plain_dirs:
+            timings.measure('process_project_warm', main.process_project, path, spec.owner, 'bench_token', '')
+        for path in repos:
+            timings.measure('autosave_bypass_check', autosave.autosave, path, '', True)
+
+        server.shutdown()
+        server.server_close()
+        return {
+            'spec': dataclasses.asdict(spec),
+            'settings': settings or {},
+            'farm_seconds': round(farm_seconds, 4),
+            'timings': timings.summary(),
+        }
+
+def compare(results, baseline, tolerance):
+    """Return {name: ratio} for every timing whose mean grew by more than the tolerance."""
+    regressions = {}
+    for name, timing in results['timings'].items():
+        previous = baseline.get('timings', {}).get(name)
+        if previous and previous['mean'] > 0:
+            ratio = timing['mean'] / previous['mean']
+            timing['baseline_ratio'] = round(ratio, 3)
+            if ratio > 1 + tolerance:
+                regressions[name] = round(ratio, 3)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    for field in dataclasses.fields(FarmSpec):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=field.type if isinstance(field.type, type) else type(field.default), default=field.default)
+    parser.add_argument('--setting', action='append', default=[], metavar='KEY=VALUE', help="Extra config file setting, e.g. autosave_mode=snapshot (repeatable)")
+    parser.add_argument('--output', help="Also write the results to this file, e.g. to use as a baseline")
+    parser.add_argument('--baseline', help="Compare against results stored earlier with --output")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown against the baseline (default 0.2, i.e. 20%%)")
+    args = parser.parse_args()
+
+    spec = FarmSpec(**{field.name: getattr(args, field.name) for field in dataclasses.fields(FarmSpec)})
+    results = run(spec, dict(setting.split('=', 1) for setting in args.setting))
+    regressions = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results['regressions'] = regressions
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
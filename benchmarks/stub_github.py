@@ -0,0 +1,104 @@
+"""Minimal stand-in for the parts of the GitHub REST API the autosave tool uses.
+
+Repositories are bare git repositories under <remotes_dir>/<owner>/<name>.git, so the same
+directory can serve git traffic through a url.<remotes_dir>.insteadOf rewrite of
+https://github.com/.
+"""
+import os
+import json
+import threading
+import subprocess
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE_SIZE = 30
+
+class StubGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.calls += 1
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        if parts[:2] == ['user', 'repos']:
+            query = parse_qs(url.query)
+            page = int(query.get('page', ['1'])[0])
+            per_page = int(query.get('per_page', [str(PAGE_SIZE)])[0])
+            repos = self.server.list_repos()
+            headers = {}
+            if page * per_page < len(repos):
+                base = f'http://{self.headers["Host"]}/user/repos?per_page={per_page}'
+                last = (len(repos) + per_page - 1) // per_page
+                headers['Link'] = f'<{base}&page={page + 1}>; rel="next", <{base}&page={last}>; rel="last"'
+            self.send_json(200, [self.repo_json(owner, name) for owner, name in repos[(page - 1) * per_page:page * per_page]], headers)
+        elif parts[0] == 'repos' and len(parts) == 3:
+            if os.path.isdir(self.server.remote_path(parts[1], parts[2])):
+                self.send_json(200, self.repo_json(parts[1], parts[2]))
+            else:
+                self.send_json(404, {'message': 'Not Found'})
+        else:
+            self.send_json(404, {'message': 'Not Found'})
+
+    def do_POST(self):
+        self.server.calls += 1
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if urlparse(self.path).path.strip('/') != 'user/repos':
+            self.send_json(404, {'message': 'Not Found'})
+            return
+        path = self.server.remote_path(self.server.owner, body['name'])
+        if os.path.exists(path):
+            self.send_json(422, {'message': 'Repository creation failed.', 'errors': [{'message': 'name already exists on this account'}]})
+            return
+        subprocess.run(['git', 'init', '--quiet', '--bare', path], check=True)
+        self.send_json(201, self.repo_json(self.server.owner, body['name']))
+
+    def repo_json(self, owner, name):
+        return {
+            'name': name,
+            'full_name': f"{owner}/{name}",
+            'owner': {'login': owner},
+            'html_url': f"https://github.com/{owner}/{name}",
+            'clone_url': f"https://github.com/{owner}/{name}.git",
+            'default_branch': 'main',
+        }
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class StubGitHubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, remotes_dir, owner):
+        super().__init__(('127.0.0.1', 0), StubGitHubHandler)
+        self.remotes_dir = remotes_dir
+        self.owner = owner
+        self.calls = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def remote_path(self, owner, name):
+        return os.path.join(self.remotes_dir, owner, f"{name}.git")
+
+    def list_repos(self):
+        repos = []
+        for owner in sorted(os.listdir(self.remotes_dir)):
+            for name in sorted(os.listdir(os.path.join(self.remotes_dir, owner))):
+                if name.endswith('.git'):
+                    repos.append((owner, name[:-len('.git')]))
+        return repos
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
@@ -0,0 +1,93 @@
+import os
+import datetime
+import logging
+
+from utils import get_setting, read_json_file, write_json_atomic
+
+SNAPSHOT_FILE = 'autosave_changes.json'
+
+def get_threshold():
+    """Return how old an unsaved change must be before it is autosaved."""
+    return datetime.timedelta(hours=get_setting('autosave_threshold_hours', 24, float))
+
+def get_changes(repo, now, threshold=None):
+    """Return the paths with unsaved changes older than the threshold.
+
+    Staged, unstaged and untracked changes are all considered. Paths whose size, mtime
+    and inode are unchanged since the last autosave were already saved and are skipped.
+    """
+    if threshold is None:
+        threshold = get_threshold()
+    return [change['path'] for change in scan_changes(repo)
+            if not change['saved'] and now - change['modified'] >= threshold]
+
+def scan_changes(repo):
+    """List every dirty path in the working tree with its stat data and whether the last autosave already covers it."""
+    saved = load_snapshot(repo).get('saved', {})
+    changes = []
+    for path, status in git_status(repo):
+        signature = stat_signature(os.path.join(repo.working_dir, path))
+        if signature is None:
+            # Deleted paths have no mtime of their own; the containing directory changed when they went away
+            parent = stat_signature(os.path.dirname(os.path.join(repo.working_dir, path)))
+            modified = parent[1] if parent else 0
+            size = 0
+        else:
+            size, modified = signature[0], signature[1]
+        changes.append({
+            'path': path,
+            'status': status,
+            'size': size,
+            'modified': datetime.datetime.fromtimestamp(modified / 1e9),
+            'saved': path in saved and saved[path] == signature,
+        })
+    return changes
+
+def git_status(repo):
+    """Return (path, status) for every changed or untracked path, using a single git status call."""
+    output = repo.git.status('--porcelain=v2', '-z', '--untracked-files=all', '--ignore-submodules=dirty')
+    entries = output.split('\0')
+    changes = []
+    index = 0
+    while index < len(entries):
+        entry = entries[index]
+        index += 1
+        if not entry:
+            continue
+        kind = entry[0]
+        if kind == '1':
+            fields = entry.split(' ', 8)
+            changes.append((fields[8], fields[1]))
+        elif kind == '2':
+            fields = entry.split(' ', 9)
+            changes.append((fields[9], fields[1]))
+            # The original path of a rename or copy follows as its own entry
+            index += 1
+        elif kind == 'u':
+            fields = entry.split(' ', 10)
+            changes.append((fields[10], fields[1]))
+        elif kind == '?':
+            changes.append((entry[2:], '??'))
+    return changes
+
+def stat_signature(path):
+    """Return [size, mtime_ns, inode] for a path, or None if it does not exist."""
+    try:
+        stat = os.lstat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+def load_snapshot(repo):
+    """Load the state recorded by the last autosave of this repository."""
+    return read_json_file(os.path.join(repo.git_dir, SNAPSHOT_FILE)) or {}
+
+def record_autosave(repo, tree_sha):
+    """Remember the current dirty paths and the autosaved tree so unchanged edits are not saved again."""
+    saved = {path: stat_signature(os.path.join(repo.working_dir, path)) for path, _ in git_status(repo)}
+    write_json_atomic(os.path.join(repo.git_dir, SNAPSHOT_FILE), {
+        'tree': tree_sha,
+        'saved': saved,
+        'saved_at': datetime.datetime.now().isoformat(),
+    })
+    logging.debug("Recorded autosave snapshot of %s paths for tree %s.", len(saved), tree_sha)
@@ -0,0 +1,144 @@
+import os
+import fnmatch
+import logging
+import datetime
+import threading
+
+import metrics
+from utils import get_cache_dir, get_setting
+
+SYSTEM_PROMPT = "You are one of the best coding mentors in the world."
+
+# Files whose diffs say nothing useful about the change and can run to megabytes
+DEFAULT_IGNORE_PATTERNS = [
+    '*.lock', 'package-lock.json', 'pnpm-lock.yaml', 'go.sum', 'composer.lock',
+    '*.min.js', '*.min.css', '*.map', '*.pb.go', '*_pb2.py',
+    'dist/*', 'build/*', 'vendor/*', 'node_modules/*',
+]
+
+# Rough conversion used to keep prompts under the token budget without a tokenizer
+CHARS_PER_TOKEN = 4
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(openai_key):
+    """Return a shared OpenAI client for a key, creating it on first use."""
+    key = (openai_key, get_setting('openai_base_url'))
+    with _clients_lock:
+        if key not in _clients:
+            from openai import OpenAI
+            _clients[key] = OpenAI(
+                api_key=openai_key,
+                base_url=get_setting('openai_base_url'),
+                timeout=get_setting('openai_timeout', 30, float),
+                max_retries=get_setting('openai_max_retries', 1, int),
+            )
+        return _clients[key]
+
+def split_diff(diff):
+    """Split a unified git diff into (path, patch) pairs, one per file."""
+    files = []
+    for line in diff.splitlines(keepends=True):
+        if line.startswith('diff --git '):
+            path = line.rstrip('\n').split(' b/', 1)[-1]
+            files.append([path, line])
+        elif files:
+            files[-1][1] += line
+    return [(path, patch) for path, patch in files]
+
+def is_ignored(path, patterns):
+    return any(fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(os.path.basename(path), pattern) for pattern in patterns)
+
+def summarize_diff(diff, max_tokens=None, ignore_patterns=None):
+    """Reduce a diff to fit the prompt budget.
+
+    Every file gets a stat line; patches follow for files that are not binary or matched
+    by the ignore patterns, in order, until the budget runs out. A patch that does not fit
+    is truncated and the remaining files are represented by their stat lines only.
+    """
+    max_tokens = max_tokens or get_setting('ai_message_max_tokens', 4000, int)
+    if ignore_patterns is None:
+        ignore_patterns = DEFAULT_IGNORE_PATTERNS + [pattern.strip() for pattern in get_setting('ai_message_ignore', '').split(',') if pattern.strip()]
+    budget = max_tokens * CHARS_PER_TOKEN
+    if len(diff) <= budget and not any(is_ignored(path, ignore_patterns) for path, _ in split_diff(diff)):
+        return diff
+
+    stats = []
+    patches = []
+    for path, patch in split_diff(diff):
+        lines = patch.splitlines()
+        if any(line.startswith('Binary files ') or line == 'GIT binary patch' for line in lines):
+            stats.append(f"{path} | binary")
+            continue
+        added = sum(1 for line in lines if line.startswith('+') and not line.startswith('+++'))
+        removed = sum(1 for line in lines if line.startswith('-') and not line.startswith('---'))
+        if is_ignored(path, ignore_patterns):
+            stats.append(f"{path} | +{added} -{removed} (not shown)")
+            continue
+        stats.append(f"{path} | +{added} -{removed}")
+        patches.append(patch)
+
+    summary = "Files changed:\n" + "\n".join(stats) + "\n\n"
+    remaining = budget - len(summary)
+    for patch in patches:
+        if remaining <= 0:
+            break
+        if len(patch) > remaining:
+            patch = patch[:remaining] + "\n... (truncated)\n"
+        summary += patch
+        remaining -= len(patch)
+    return summary
+
+def build_messages(changes):
+    prompt = f"Generate a concise commit message for the following changes:\n{summarize_diff(changes)}"
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+def fallback_message():
+    return f"Autosave commit at {datetime.datetime.now()}"
+
+def cached_message(tree_hash):
+    """Return the message generated earlier for a tree, if any."""
+    if not tree_hash:
+        return None
+    try:
+        with open(os.path.join(get_cache_dir(), 'messages', tree_hash)) as f:
+            return f.read()
+    except OSError:
+        return None
+
+def cache_message(tree_hash, message):
+    if not tree_hash:
+        return
+    cache_dir = os.path.join(get_cache_dir(), 'messages')
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, tree_hash), 'w') as f:
+        f.write(message)
+
+def generate_ai_message(changes, openai_key, tree_hash=None):
+    """Generate a commit message using OpenAI based on the changes.
+
+    Messages are cached by the hash of the tree being committed, so retrying the same
+    snapshot does not query the API again.
+    """
+    message = cached_message(tree_hash)
+    if message:
+        return message
+    if not openai_key:
+        return fallback_message()
+    try:
+        metrics.incr('openai_calls')
+        with metrics.span('openai'):
+            response = get_client(openai_key).chat.completions.create(
+                model=get_setting('openai_model', 'gpt-4o-mini'),
+                messages=build_messages(changes),
+            )
+        message = response.choices[0].message.content.strip()
+    except Exception as e:
+        logging.error("Failed to generate AI message: %s", e)
+        return fallback_message()
+    cache_message(tree_hash, message)
+    return message
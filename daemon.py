@@ -0,0 +1,162 @@
+import os
+import time
+import heapq
+import queue
+import logging
+import threading
+import accounts
+import git_backend
+import git_operations
+from change_detection import scan_changes, get_threshold
+from utils import get_setting
+
+try:
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+class ProjectEventHandler:
+    """Translate filesystem events under a project root into the paths of the projects they touch."""
+
+    def __init__(self, projects_dir, events):
+        self.projects_dir = projects_dir
+        self.events = events
+
+    def dispatch(self, event):
+        for path in (event.src_path, getattr(event, 'dest_path', None)):
+            project = project_for_path(self.projects_dir, path)
+            if project:
+                self.events.put(os.path.join(self.projects_dir, project))
+
+def project_for_path(projects_dir, path):
+    """Return the project a changed path belongs to, or None for paths that cannot hold unsaved work."""
+    if not path:
+        return None
+    if isinstance(path, bytes):
+        path = os.fsdecode(path)
+    parts = os.path.relpath(path, projects_dir).split(os.sep)
+    if parts[0] in ('.', '..'):
+        return None
+    # Writes inside .git come from git itself (including our own autosaves), not from the user
+    if len(parts) > 1 and parts[1] == '.git':
+        return None
+    return parts[0]
+
+def start_watcher(roots, events):
+    """Watch the project roots for changes, natively through watchdog when available or by polling otherwise."""
+    if Observer is not None:
+        observer = Observer()
+        for projects_dir in roots:
+            observer.schedule(ProjectEventHandler(projects_dir, events), projects_dir, recursive=True)
+        observer.daemon = True
+        observer.start()
+        logging.info("Watching %s for changes.", ', '.join(roots))
+        return observer
+
+    poll_interval = get_setting('daemon_poll_interval', 300, float)
+    logging.info("watchdog is not installed, polling %s every %s seconds.", ', '.join(roots), poll_interval)
+
+    def poll():
+        while True:
+            time.sleep(poll_interval)
+            for project_path in accounts.list_projects(roots):
+                events.put(project_path)
+
+    threading.Thread(target=poll, daemon=True).start()
+    return None
+
+def oldest_unsaved_change(project_path):
+    """Return the modification time of the oldest change not covered by the last autosave, or None if there is none."""
+    changes = [change['modified'] for change in scan_changes(git_backend.open_repo(project_path)) if not change['saved']]
+    return min(changes) if changes else None
+
+def run_daemon(roots, process_project, autosave_project, include=None, events=None, clock=time):
+    """Autosave projects as their unsaved changes cross the threshold, instead of sweeping every project each hour.
+
+    process_project(path) is called once for every project the daemon has not seen before, so new
+    directories are classified and connected to GitHub. After that, a project is only looked at
+    again when files change in it (debounced), and autosave_project(path) runs once its oldest
+    unsaved change is older than the threshold. Projects for which include(path) is false,
+    such as those of another shard, are ignored.
+
+    events, a queue of changed project paths, and clock, providing monotonic() and time(),
+    replace the filesystem watcher and the time module, for tests.
+    """
+    debounce = get_setting('daemon_debounce_seconds', 5, float)
+    retry_interval = get_setting('daemon_retry_seconds', 3600, float)
+    threshold = get_threshold().total_seconds()
+    watch = events is None
+    events = queue.Queue() if watch else events
+    dirty = {}
+    due = []
+    scheduled = {}
+    known = set()
+
+    def reschedule(project_path, not_before=0):
+        scheduled.pop(project_path, None)
+        if not os.path.isdir(project_path):
+            known.discard(project_path)
+            return
+        if project_path not in known:
+            known.add(project_path)
+            process_project(project_path)
+        # The repository check and the scan share one repository handle
+        with git_backend.session(project_path):
+            if not git_operations.is_git_repo(project_path):
+                return
+            oldest = oldest_unsaved_change(project_path)
+        if oldest is None:
+            return
+        scheduled[project_path] = max(oldest.timestamp() + threshold, not_before)
+        heapq.heappush(due, (scheduled[project_path], project_path))
+        logging.debug("Project %s is due for autosave at %s.", project_path, time.ctime(scheduled[project_path]))
+
+    observer = start_watcher(roots, events) if watch else None
+    for project_path in accounts.list_projects(roots):
+        dirty[project_path] = float('-inf')
+
+    try:
+        while True:
+            wake_times = [last + debounce for last in dirty.values()]
+            if due:
+                wake_times.append(clock.monotonic() + due[0][0] - clock.time())
+            timeout = max(0, min(wake_times) - clock.monotonic()) if wake_times else None
+            try:
+                project_path = events.get(timeout=timeout)
+                dirty[project_path] = clock.monotonic()
+                while True:
+                    project_path = events.get_nowait()
+                    dirty[project_path] = clock.monotonic()
+            except queue.Empty:
+                pass
+
+            now = clock.monotonic()
+            for project_path, last in list(dirty.items()):
+                if now - last >= debounce:
+                    del dirty[project_path]
+                    if include is not None and not include(project_path):
+                        continue
+                    try:
+                        reschedule(project_path)
+                    except Exception as e:
+                        logging.error("Error checking project %s: %s", project_path, e)
+
+            while due and due[0][0] <= clock.time():
+                due_time, project_path = heapq.heappop(due)
+                if scheduled.get(project_path) != due_time:
+                    # Superseded by a later reschedule
+                    continue
+                try:
+                    autosave_project(project_path)
+                except Exception as e:
+                    logging.error("Error autosaving project %s: %s", project_path, e)
+                # Changes still unsaved after an attempt mean it failed; wait before trying again
+                try:
+                    reschedule(project_path, not_before=clock.time() + retry_interval)
+                except Exception as e:
+                    logging.error("Error checking project %s: %s", project_path, e)
+    except KeyboardInterrupt:
+        logging.info("Stopping autosave daemon.")
+    finally:
+        if observer is not None:
+            observer.stop()
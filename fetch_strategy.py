@@ -0,0 +1,76 @@
+import logging
+from git import GitCommandError
+
+import metrics
+import git_backend
+from utils import get_setting
+
+FETCH_MODES = ('full', 'changed', 'partial')
+
+def remote_heads(repo):
+    """Return {refs/heads/<branch>: sha} as advertised by origin, without downloading any objects."""
+    heads = {}
+    for line in repo.git.ls_remote('--heads', 'origin').splitlines():
+        sha, ref = line.split('\t', 1)
+        heads[ref] = sha
+    return heads
+
+def tracked_heads(repo):
+    """Return {refs/heads/<branch>: sha} for the remote-tracking refs recorded by the last fetch."""
+    tips = git_backend.session_for(repo).remote_tips()
+    return {f"refs/heads/{ref[len('refs/remotes/origin/'):]}": sha for ref, sha in tips.items()}
+
+def is_partial_clone(repo):
+    try:
+        return repo.git.config('--get', 'remote.origin.promisor') == 'true'
+    except GitCommandError:
+        return False
+
+def fetch_origin(repo, mode=None):
+    """Bring the origin remote-tracking refs up to date, downloading as little as possible.
+
+    Modes (fetch_mode setting):
+      full    - a plain fetch of every ref, as git fetch origin would do.
+      changed - compare origin's advertised heads (git ls-remote) with the remote-tracking refs
+                and fetch only the branches that moved; nothing is fetched when none did.
+      partial - like changed, but commits and trees only (--filter=blob:none), with blobs
+                fetched lazily when something needs them.
+    Repositories that already are partial clones are always fetched with the blob filter.
+    Returns True if anything was fetched or pruned.
+    """
+    mode = mode or get_setting('fetch_mode', 'changed')
+    if mode not in FETCH_MODES:
+        raise ValueError(f"Unknown fetch_mode {mode}, expected one of {', '.join(FETCH_MODES)}")
+
+    if mode == 'full':
+        with metrics.span('fetch'):
+            repo.remotes.origin.fetch()
+        git_backend.invalidate(repo)
+        return True
+
+    with metrics.span('fetch'):
+        remote = remote_heads(repo)
+        tracked = tracked_heads(repo)
+        changed = [ref for ref, sha in remote.items() if tracked.get(ref) != sha]
+        deleted = [ref for ref in tracked if ref not in remote]
+
+        for ref in deleted:
+            repo.git.update_ref('-d', f"refs/remotes/origin/{ref[len('refs/heads/'):]}")
+        if deleted:
+            git_backend.invalidate(repo)
+        if not changed:
+            logging.debug("Remote refs unchanged for %s, skipping fetch.", repo.working_dir)
+            return bool(deleted)
+
+        args = ['--no-tags', '--write-commit-graph']
+        if mode == 'partial' or is_partial_clone(repo):
+            args.append('--filter=blob:none')
+        # Only offer the remote-tracking tips during negotiation; they are what origin already has
+        if tracked:
+            args.append('--negotiation-tip=refs/remotes/origin/*')
+        refspecs = [f"+{ref}:refs/remotes/origin/{ref[len('refs/heads/'):]}" for ref in changed]
+        logging.debug("Fetching %s changed branches for %s.", len(changed), repo.working_dir)
+        repo.git.fetch(*args, 'origin', *refspecs)
+        git_backend.invalidate(repo)
+        metrics.incr('branches_fetched', len(changed))
+    return True
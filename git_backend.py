@@ -0,0 +1,108 @@
+import os
+import threading
+import contextlib
+from git import Repo
+
+REFS_FORMAT = '%(HEAD)%00%(refname)%00%(objectname)%00%(upstream)%00%(symref)'
+
+class GitSession:
+    """A repository opened once and shared by every step that processes it.
+
+    GitPython keeps one long-lived `git cat-file --batch` process per Repo for reading
+    objects, so sharing the Repo shares those processes too. Branches, upstreams and tips
+    are read with a single for-each-ref call and kept until a ref is changed.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self._refs = None
+        self._lock = threading.Lock()
+
+    def refs(self):
+        """Return {refname: {'sha', 'upstream', 'symref', 'head'}} for local and remote-tracking branches."""
+        with self._lock:
+            if self._refs is None:
+                refs = {}
+                output = self.repo.git.for_each_ref(f'--format={REFS_FORMAT}', 'refs/heads/', 'refs/remotes/')
+                for line in output.splitlines():
+                    head, refname, sha, upstream, symref = line.split('\0')
+                    refs[refname] = {'sha': sha, 'upstream': upstream or None, 'symref': symref or None, 'head': head == '*'}
+                self._refs = refs
+            return self._refs
+
+    def invalidate(self):
+        """Forget the cached refs after a command that may have changed them."""
+        with self._lock:
+            self._refs = None
+
+    def branches(self):
+        """Return {branch name: {'sha', 'upstream', ...}} for the local branches."""
+        return {refname[len('refs/heads/'):]: ref for refname, ref in self.refs().items() if refname.startswith('refs/heads/')}
+
+    def current_branch(self):
+        """Return the name of the checked out branch, or None if HEAD is detached."""
+        return next((name for name, ref in self.branches().items() if ref['head']), None)
+
+    def remote_tips(self, remote='origin'):
+        """Return {refname: sha} for the branches of a remote, leaving out its HEAD symref."""
+        prefix = f'refs/remotes/{remote}/'
+        return {refname: ref['sha'] for refname, ref in self.refs().items() if refname.startswith(prefix) and not ref['symref']}
+
+    def close(self):
+        """Stop the git processes kept open for this repository."""
+        self.repo.close()
+
+# Sessions shared within a session() block, by absolute path; None until the repository is first used
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+@contextlib.contextmanager
+def session(path):
+    """Share one GitSession for path with everything called inside the block, and close it afterwards.
+
+    The repository is only opened on first use, so the block can start before path is a repository.
+    """
+    key = os.path.abspath(path)
+    with _sessions_lock:
+        if key in _sessions:
+            nested = True
+        else:
+            nested = False
+            _sessions[key] = None
+    try:
+        yield
+    finally:
+        if not nested:
+            with _sessions_lock:
+                opened = _sessions.pop(key, None)
+            if opened is not None:
+                opened.close()
+
+def get_session(path):
+    """Return the shared session for path inside a session() block, or a new session owned by the caller."""
+    key = os.path.abspath(path)
+    with _sessions_lock:
+        if key not in _sessions:
+            return GitSession(Repo(path))
+        if _sessions[key] is None:
+            _sessions[key] = GitSession(Repo(path))
+        return _sessions[key]
+
+def open_repo(path):
+    """Return the Repo for path, shared with the rest of the session() block if there is one."""
+    return get_session(path).repo
+
+def session_for(repo):
+    """Return the session a Repo belongs to, or a new one around it if it is not shared."""
+    with _sessions_lock:
+        shared = _sessions.get(os.path.abspath(repo.working_dir))
+    if shared is not None and shared.repo is repo:
+        return shared
+    return GitSession(repo)
+
+def invalidate(repo):
+    """Forget the cached refs of the shared session of this Repo, after a command that changed refs."""
+    with _sessions_lock:
+        shared = _sessions.get(os.path.abspath(repo.working_dir))
+    if shared is not None and shared.repo is repo:
+        shared.invalidate()
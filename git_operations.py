@@ -1,178 +1,290 @@
 import os
 import git
 import logging
-import requests
 from git.exc import GitCommandError
 from git import Repo
 import shutil
 
+import metrics
+import throttle
+import git_backend
+from github_client import get_client
+from fetch_strategy import fetch_origin
+from repo_index import get_repo_index, add_to_repo_index
+from utils import read_json_file, write_json_atomic
+
 def is_git_repo(path):
     """Check if the given path is a git repository."""
-    logging.debug(f"Checking if the path {path} is a git repository.")
+    logging.debug("Checking if the path %s is a git repository.", path)
     try:
-        _ = git.Repo(path).git_dir
-        logging.debug(f"The path {path} is a git repository.")
+        _ = git_backend.open_repo(path).git_dir
+        logging.debug("The path %s is a git repository.", path)
         return True
     except git.exc.InvalidGitRepositoryError:
-        logging.debug(f"The path {path} is not a git repository.")
+        logging.debug("The path %s is not a git repository.", path)
         return False
 
 def match_local_repo_to_remote_repo(path, github_username, github_token):
-    """Match a local git repository to a remote GitHub repository."""
-    logging.debug(f"Attempting to match local repository at {path} to a remote repository.")
-    try:
-        repo = Repo(path)
-        if 'origin' not in repo.remotes:
-            logging.debug(f"No remote named 'origin' found in the repository at {path}.")
-            return None
+    """Match a local git repository to a remote GitHub repository.
 
-        remote_url = repo.remotes.origin.url
-        logging.debug(f"Found remote URL: {remote_url}")
-        if 'github.com' not in remote_url:
-            logging.debug(f"Remote URL {remote_url} is not a GitHub repository.")
-            return None
+    Returns None only when there is no match to be had: origin is missing, not on GitHub, gone
+    from GitHub or empty. Git and API errors are raised, so a failed fetch is not mistaken for
+    a missing repository and answered by creating a new one.
+    """
+    logging.debug("Attempting to match local repository at %s to a remote repository.", path)
+    repo = git_backend.open_repo(path)
+    if 'origin' not in repo.remotes:
+        logging.debug("No remote named 'origin' found in the repository at %s.", path)
+        return None
 
-        logging.debug(f"Remote URL {remote_url} is a GitHub repository.")
-        repo_name = remote_url.split('github.com/')[1].rstrip('.git')
-        url = f"https://api.github.com/repos/{repo_name}"
-        headers = {'Authorization': f'token {github_token}'}
-        response = requests.get(url, headers=headers)
+    remote_url = repo.remotes.origin.url
+    logging.debug("Found remote URL: %s", remote_url)
+    if 'github.com' not in remote_url:
+        logging.debug("Remote URL %s is not a GitHub repository.", remote_url)
+        return None
 
-        if response.status_code != 200:
-            logging.debug(f"Remote repository {remote_url} does not exist on GitHub.")
-            return None
+    logging.debug("Remote URL %s is a GitHub repository.", remote_url)
+    repo_name = remote_url.split('github.com/')[1].rstrip('.git')
+    client = get_client(github_token)
+    response = client.get(f"repos/{repo_name}")
 
-        logging.debug(f"Remote repository {remote_url} exists on GitHub.")
-        origin = repo.remotes.origin
-        origin.fetch()
+    if response.status_code == 404:
+        logging.debug("Remote repository %s does not exist on GitHub.", remote_url)
+        return None
+    if response.status_code != 200:
+        raise Exception(f"Failed to look up remote repository {remote_url}: {response.status_code}")
 
-        remote_branches = origin.refs
-        if not remote_branches:
-            logging.debug(f"No remote branches found for {remote_url}")
-            return None
+    logging.debug("Remote repository %s exists on GitHub.", remote_url)
+    fetch_origin(repo)
 
-        for remote_branch in remote_branches:
-            try:
-                remote_commits = set(repo.git.rev_list(remote_branch.name).split())
-                local_commits = set(repo.git.rev_list('HEAD').split())
-                if remote_commits & local_commits:
-                    logging.debug(f"Local and remote repositories share common commits.")
-                    return remote_url
-            except GitCommandError as e:
-                logging.debug(f"Error checking commits for branch {remote_branch.name}: {e}")
-                continue
-
-        logging.debug(f"No common commits found. Renaming local repository and pushing it up.")
-        base_repo_name = os.path.basename(path)
-        increment = 2
+    remote_tips = git_backend.session_for(repo).remote_tips()
+    if not remote_tips:
+        logging.debug("No remote branches found for %s", remote_url)
+        return None
+
+    try:
+        head_sha = repo.head.commit.hexsha
+    except ValueError:
+        head_sha = None
+    if head_sha:
+        with metrics.span('ancestry'):
+            remote_shas = set(remote_tips.values())
+            shared = any(shares_history(repo, head_sha, remote_sha) for remote_sha in remote_shas)
+        if shared:
+            logging.debug("Local and remote repositories share common commits.")
+            return remote_url
+
+    logging.debug("No common commits found. Renaming local repository and pushing it up.")
+    base_repo_name = os.path.basename(path)
+    increment = 2
+    new_repo_name = f"{base_repo_name}_{increment}"
+
+    while True:
+        response = client.get(f"repos/{github_username}/{new_repo_name}")
+        if response.status_code == 404:
+            break
+        if response.status_code != 200:
+            raise Exception(f"Failed to look up repository {github_username}/{new_repo_name}: {response.status_code}")
+        increment += 1
         new_repo_name = f"{base_repo_name}_{increment}"
 
-        while True:
-            url = f"https://api.github.com/repos/{github_username}/{new_repo_name}"
-            response = requests.get(url, headers=headers)
-            if response.status_code == 404:
-                break
-            increment += 1
-            new_repo_name = f"{base_repo_name}_{increment}"
-
-        new_path = os.path.join(os.path.dirname(path), new_repo_name)
-        os.rename(path, new_path)
-        repo = Repo(new_path)
-        repo.create_remote('origin', f"https://github.com/{github_username}/{new_repo_name}.git")
-        repo.remotes.origin.push(repo.head.ref)
-        logging.debug(f"Renamed local repository to {new_repo_name} and pushed to remote.")
-        return f"https://github.com/{github_username}/{new_repo_name}.git"
-    except Exception as e:
-        logging.debug(f"Failed to match local repository to remote repository: {e}")
+    throttle.check_deadline(f"renaming {path} to {new_repo_name}")
+    new_path = os.path.join(os.path.dirname(path), new_repo_name)
+    os.rename(path, new_path)
+    repo = Repo(new_path)
+    repo.create_remote('origin', f"https://github.com/{github_username}/{new_repo_name}.git")
+    repo.remotes.origin.push(repo.head.ref)
+    logging.debug("Renamed local repository to %s and pushed to remote.", new_repo_name)
+    return f"https://github.com/{github_username}/{new_repo_name}.git"
+
+def revalidate_remote_match(path, project_state):
+    """Confirm a match recorded by an earlier run using local checks only, without calling the GitHub API.
+
+    The match holds while origin still points at the recorded URL and HEAD is either where it
+    was or still shares history with a remote branch. Returns the remote URL, or None if the
+    project has to be matched from scratch.
+    """
+    if not project_state or project_state['classification'] != 'matched':
         return None
+    try:
+        repo = git_backend.open_repo(path)
+        if 'origin' not in repo.remotes or repo.remotes.origin.url != project_state['remote_url']:
+            logging.debug("Remote URL of %s changed since the last run.", path)
+            return None
+        fetch_origin(repo)
+        head_sha = repo.head.commit.hexsha
+        if head_sha != project_state['head']:
+            with metrics.span('ancestry'):
+                remote_shas = set(git_backend.session_for(repo).remote_tips().values())
+                if not any(shares_history(repo, head_sha, remote_sha) for remote_sha in remote_shas):
+                    logging.debug("HEAD of %s moved to %s and no longer shares history with origin.", path, head_sha)
+                    return None
+        logging.debug("Reusing the recorded match of %s to %s.", path, project_state['remote_url'])
+        return project_state['remote_url']
+    except (GitCommandError, ValueError, git.exc.InvalidGitRepositoryError) as e:
+        logging.debug("Could not revalidate the recorded match of %s: %s", path, e)
+        return None
+
+def describe_repo(path):
+    """Return the remote URL, HEAD and remote branch tips of a repository, as recorded in the state store."""
+    session = git_backend.get_session(path)
+    repo = session.repo
+    try:
+        head = repo.head.commit.hexsha
+    except ValueError:
+        head = None
+    origin = repo.remotes.origin if 'origin' in repo.remotes else None
+    return {
+        'remote_url': origin.url if origin else None,
+        'head': head,
+        'remote_tips': {ref[len('refs/remotes/origin/'):]: sha for ref, sha in session.remote_tips().items()} if origin else {},
+    }
+
+def shares_history(repo, head_sha, remote_sha, write_cache=True):
+    """Check whether two commits have a common ancestor.
+
+    Uses git merge-base, which walks only as far back as needed (and uses the commit-graph
+    when present), and caches the answer per (HEAD, remote tip) pair in the git directory.
+    With write_cache False the cache is read but never updated, for dry runs.
+    """
+    cache_path = os.path.join(repo.git_dir, 'autosave_ancestry.json')
+    cache = read_json_file(cache_path) or {}
+    key = f"{head_sha}:{remote_sha}"
+    if key in cache:
+        return cache[key]
+
+    try:
+        repo.git.merge_base(head_sha, remote_sha)
+        result = True
+    except GitCommandError as e:
+        # merge-base exits with status 1 when the commits share no history; anything else,
+        # such as a command killed at the project timeout, is not an answer
+        if e.status != 1:
+            raise
+        result = False
+    if not write_cache:
+        return result
+
+    # Entries for earlier HEADs can never be hit again, so only keep the current one's
+    cache = {k: v for k, v in cache.items() if k.startswith(f"{head_sha}:")}
+    cache[key] = result
+    write_json_atomic(cache_path, cache)
+    return result
 
 def match_local_dir_to_remote_repo(path, github_username, github_token):
     """Match a local directory to a remote GitHub repository based on name."""
     dir_name = os.path.basename(path)
-    logging.debug(f"Attempting to match local directory {dir_name} to a remote repository.")
-    url = f"https://api.github.com/user/repos"
-    headers = {'Authorization': f'token {github_token}'}
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        logging.debug(f"Successfully fetched repositories for user {github_username}.")
-        repos = response.json()
-        for repo in repos:
-            if repo['name'].lower() == dir_name.lower():
-                logging.debug(f"Found matching repository: {repo['html_url']}")
-                return repo['html_url']
-    logging.debug(f"No matching repository found for directory {dir_name}.")
+    logging.debug("Attempting to match local directory %s to a remote repository.", dir_name)
+    repo = get_repo_index(github_username, github_token).get(dir_name.lower())
+    if repo:
+        logging.debug("Found matching repository: %s", repo['html_url'])
+        return repo['html_url']
+    logging.debug("No matching repository found for directory %s.", dir_name)
     return None
 
 def create_and_initialize_local_repo(path, github_username, github_token):
     """Create a new local GitHub repository, local repo does not exist."""
-    logging.debug(f"Creating and initializing a new local repository at {path}.")
+    logging.debug("Creating and initializing a new local repository at %s.", path)
+    throttle.check_deadline(f"initializing a repository in {path}")
     try:
         repo = Repo.init(path)
         repo.git.add(A=True)  # Add all files to the repository
         repo.index.commit("Initial commit")
-        logging.debug(f"Initialized a new local repository at {path}.")
+        logging.debug("Initialized a new local repository at %s.", path)
     except GitCommandError as e:
-        logging.error(f"Failed to create and initialize local repository at {path}: {e}")
+        logging.error("Failed to create and initialize local repository at %s: %s", path, e)
         raise
 
 def create_and_initialize_remote_repo(path, github_username, github_token):
     """Create a new remote GitHub repository, local repo already exists."""
-    logging.debug(f"Creating and initializing a new remote repository for local repo at {path}.")
+    logging.debug("Creating and initializing a new remote repository for local repo at %s.", path)
+    throttle.check_deadline(f"creating a remote repository for {path}")
     try:
         base_repo_name = os.path.basename(path)
         repo_name = base_repo_name
-        url = f"https://api.github.com/user/repos"
-        headers = {'Authorization': f'token {github_token}'}
+        client = get_client(github_token)
         data = {'name': repo_name, 'private': False}
-        response = requests.post(url, headers=headers, json=data)
+        response = client.post("user/repos", json=data)
         
         increment = 1
         while response.status_code == 422 and 'name already exists on this account' in response.text:
             increment += 1
             repo_name = f"{base_repo_name}_{increment}"
             data['name'] = repo_name
-            response = requests.post(url, headers=headers, json=data)
+            response = client.post("user/repos", json=data)
         
         if response.status_code != 201:
-            logging.error(f"Failed to create remote repository: {response.json()}")
+            logging.error("Failed to create remote repository: %s", response.json())
             raise Exception(f"Failed to create remote repository: {response.json()}")
 
+        add_to_repo_index(github_token, response.json())
         remote_url = response.json()['clone_url']
-        repo = Repo(path)
+        repo = git_backend.open_repo(path)
         
         if not repo.head.is_valid():
             repo.git.add(A=True)
             repo.index.commit("Initial commit")
         
         if 'origin' in repo.remotes:
-            logging.debug(f"Remote 'origin' already exists. Updating URL to {remote_url}.")
+            logging.debug("Remote 'origin' already exists. Updating URL to %s.", remote_url)
             repo.remotes.origin.set_url(remote_url)
             origin = repo.remotes.origin
         else:
             origin = repo.create_remote('origin', remote_url)
         origin.push(repo.head.ref)
-        logging.debug(f"Created and pushed to new remote repository {remote_url} for local repo at {path}.")
+        git_backend.invalidate(repo)
+        logging.debug("Created and pushed to new remote repository %s for local repo at %s.", remote_url, path)
     except Exception as e:
-        logging.error(f"Failed to create and initialize remote repository for local repo at {path}: {e}")
+        logging.error("Failed to create and initialize remote repository for local repo at %s: %s", path, e)
         raise
 
 def reconcile_local_dir_and_remote_repo(path, remote_url, github_username, github_token):
-    """Reconcile the contents of a local directory with a remote repository."""
-    logging.debug(f"Reconciling local directory {path} with remote repository.")
+    """Reconcile the contents of a local directory with a remote repository.
+
+    The directory becomes a repository tracking the remote's default branch without any of
+    its files being moved or rewritten: the history is fetched as a partial clone (commits and
+    trees only) and a mixed reset points the index at it, leaving local edits as unstaged
+    changes. Everything is built in a staging git directory that is renamed to .git only once
+    it is complete, so an interrupted run leaves a plain directory behind.
+    """
+    logging.debug("Reconciling local directory %s with remote repository.", path)
+    git_dir = os.path.join(path, '.git')
+    staging_dir = os.path.join(path, '.git_autosave_reconcile')
+    throttle.check_deadline(f"reconciling {path}")
 
     try:
-        temp_dir = os.path.join(os.path.dirname(path), 'temp')
-        
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        
-        shutil.copytree(path, temp_dir)
-        shutil.rmtree(path)
-        Repo.clone_from(remote_url, path)
-        shutil.copytree(temp_dir, path, dirs_exist_ok=True)
-        shutil.rmtree(temp_dir)
-        
+        if os.path.exists(git_dir):
+            raise Exception(f"{git_dir} already exists")
+        if os.path.exists(staging_dir):
+            # Left over from an interrupted reconcile
+            shutil.rmtree(staging_dir)
+
+        git.Git(path).init('--bare', '--quiet', staging_dir)
+        staging = git.Git(path)
+        staging.update_environment(GIT_DIR=staging_dir, GIT_WORK_TREE=path)
+        staging.config('core.bare', 'false')
+        staging.remote('add', 'origin', remote_url)
+
+        default_branch = None
+        for line in staging.ls_remote('--symref', 'origin', 'HEAD').splitlines():
+            if line.startswith('ref: refs/heads/'):
+                default_branch = line.split('\t')[0][len('ref: refs/heads/'):]
+        if default_branch:
+            with metrics.span('fetch'):
+                staging.fetch('--filter=blob:none', '--no-tags', 'origin', f"+refs/heads/{default_branch}:refs/remotes/origin/{default_branch}")
+            staging.symbolic_ref('HEAD', f"refs/heads/{default_branch}")
+            staging.update_ref(f"refs/heads/{default_branch}", f"refs/remotes/origin/{default_branch}")
+            staging.config(f"branch.{default_branch}.remote", 'origin')
+            staging.config(f"branch.{default_branch}.merge", f"refs/heads/{default_branch}")
+            # Only the index is reset; the working tree keeps the local files as they are
+            staging.reset('--mixed', '--quiet')
+        else:
+            logging.debug("Remote repository %s is empty, nothing to fetch.", remote_url)
+
+        os.rename(staging_dir, git_dir)
         return True
     except Exception as e:
-        logging.error(f"Failed to reconcile local directory with remote repository: {e}")
-        return False
\ No newline at end of file
+        logging.error("Failed to reconcile local directory with remote repository: %s", e)
+        if os.path.exists(staging_dir):
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        return False
@@ -0,0 +1,165 @@
+import time
+import logging
+import threading
+
+import metrics
+from utils import get_setting
+
+GITHUB_API_URL = "https://api.github.com"
+
+class GitHubClient:
+    """Shared GitHub API client with keep-alive connections, conditional requests and rate limit backoff."""
+
+    def __init__(self, github_token, api_url=GITHUB_API_URL, pool_size=10, timeout=30, max_retries=3, max_wait=900, etag_ttl=3600):
+        self.api_url = api_url.rstrip('/')
+        self.etag_ttl = etag_ttl
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        # requests is only imported once the GitHub API is actually needed, to keep startup fast
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'token {github_token}',
+            'Accept': 'application/vnd.github+json',
+        })
+        # url -> (time.monotonic() when stored, response); entries expire so a long-running daemon does not grow it forever
+        self._etag_cache = {}
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+
+    def url(self, path):
+        """Resolve an API path (or an absolute URL, such as a pagination link) to a full URL."""
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.api_url}/{path.lstrip('/')}"
+
+    def get(self, path, **kwargs):
+        """GET an API resource, revalidating previously seen responses with If-None-Match.
+
+        A 304 answer does not count against the rate limit and returns the cached response.
+        """
+        url = self.url(path)
+        if kwargs.get('params'):
+            from requests import Request
+            url = Request('GET', url, params=kwargs.pop('params')).prepare().url
+        headers = dict(kwargs.pop('headers', None) or {})
+        with self._lock:
+            stored_at, cached = self._etag_cache.get(url, (None, None))
+            if cached is not None and time.monotonic() - stored_at >= self.etag_ttl:
+                del self._etag_cache[url]
+                cached = None
+        if cached is not None:
+            headers['If-None-Match'] = cached.headers['ETag']
+
+        response = self.request('GET', url, headers=headers, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            logging.debug("GitHub resource %s not modified, using cached response.", url)
+            return cached
+        if response.status_code == 200 and response.headers.get('ETag'):
+            now = time.monotonic()
+            with self._lock:
+                self._etag_cache = {key: entry for key, entry in self._etag_cache.items() if now - entry[0] < self.etag_ttl}
+                self._etag_cache[url] = (now, response)
+        return response
+
+    def post(self, path, **kwargs):
+        """POST to an API resource."""
+        return self.request('POST', self.url(path), **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """Send a request, waiting out primary and secondary rate limits."""
+        response = None
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_rate_limit()
+            metrics.incr('github_api_calls')
+            with metrics.span('github_api'):
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            self._record_rate_limit(response)
+            delay = self._retry_delay(response, attempt)
+            if delay is None or attempt == self.max_retries:
+                break
+            if delay > self.max_wait:
+                logging.error("GitHub rate limit resets in %.0f seconds, not waiting for %s %s.", delay, method, url)
+                break
+            logging.warning("GitHub rate limit hit for %s %s, retrying in %.0f seconds.", method, url, delay)
+            time.sleep(delay)
+        return response
+
+    def _wait_for_rate_limit(self):
+        # Once the primary budget is exhausted, hold every request until the window resets
+        with self._lock:
+            delay = self._blocked_until - time.time()
+        if 0 < delay <= self.max_wait:
+            logging.warning("GitHub rate limit exhausted, waiting %.0f seconds for reset.", delay)
+            time.sleep(delay)
+
+    def _record_rate_limit(self, response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is not None and reset is not None and int(remaining) == 0:
+            with self._lock:
+                self._blocked_until = int(reset)
+
+    def _retry_delay(self, response, attempt):
+        """Seconds to wait before retrying a rate limited response, or None if it should not be retried."""
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None:
+            return float(retry_after)
+        if response.headers.get('X-RateLimit-Remaining') == '0':
+            return max(0, int(response.headers.get('X-RateLimit-Reset', 0)) - time.time())
+        if 'secondary rate limit' in response.text.lower():
+            # GitHub asks for at least a minute between retries when no Retry-After is sent
+            return 60 * 2 ** attempt
+        return None
+
+class AsyncGitHubClient:
+    """asyncio front end to a GitHubClient that shares its connection pool and ETag cache."""
+
+    def __init__(self, client, concurrency=8):
+        import asyncio
+        self.client = client
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def get(self, path, **kwargs):
+        import asyncio
+        async with self._semaphore:
+            return await asyncio.to_thread(self.client.get, path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        import asyncio
+        async with self._semaphore:
+            return await asyncio.to_thread(self.client.post, path, **kwargs)
+
+    async def get_many(self, paths):
+        """GET several resources concurrently, returning responses in the same order."""
+        import asyncio
+        return await asyncio.gather(*(self.get(path) for path in paths))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(github_token):
+    """Return the shared client for a token, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(github_token)
+        if client is None:
+            concurrency = get_setting('github_concurrency', 8, int)
+            client = GitHubClient(
+                github_token,
+                api_url=get_setting('github_api_url', GITHUB_API_URL),
+                pool_size=concurrency,
+                etag_ttl=get_setting('repo_index_ttl', 3600, int),
+            )
+            _clients[github_token] = client
+        return client
+
+def get_async_client(github_token):
+    """Return an asyncio client backed by the shared client for a token."""
+    return AsyncGitHubClient(get_client(github_token), concurrency=get_setting('github_concurrency', 8, int))
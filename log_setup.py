@@ -0,0 +1,132 @@
+import os
+import gzip
+import json
+import time
+import queue
+import atexit
+import shutil
+import logging
+import datetime
+import threading
+import logging.handlers
+
+from utils import get_setting
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - [%(project)s] %(message)s'
+LOG_FILE = 'autosave.log'
+
+# Path of the project handled by the current worker thread, used to tag log records
+_context = threading.local()
+
+def set_project(project):
+    """Tag the log records of the current thread with a project path, or '-' for none."""
+    _context.project = project
+
+class ProjectContextFilter(logging.Filter):
+    """Tag each log record with the project being processed by the current thread."""
+    def filter(self, record):
+        record.project = getattr(_context, 'project', '-')
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, for log shippers."""
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'project': getattr(record, 'project', '-'),
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotate the log when it reaches max_bytes or a new day starts, gzip rotated files and expire old ones.
+
+    Rotated files are named <file>.<YYYYmmdd-HHMMSS-microseconds>.gz and deleted after keep_days days
+    or once there are more than keep_files of them (0 disables either limit).
+    """
+
+    def __init__(self, filename, max_bytes=0, keep_days=0, keep_files=0):
+        super().__init__(filename, maxBytes=max_bytes, encoding='utf-8', delay=True)
+        self.keep_days = keep_days
+        self.keep_files = keep_files
+        self.opened_on = self._file_date()
+
+    def _file_date(self):
+        try:
+            return datetime.date.fromtimestamp(os.path.getmtime(self.baseFilename))
+        except OSError:
+            return datetime.date.today()
+
+    def shouldRollover(self, record):
+        if os.path.exists(self.baseFilename) and self.opened_on != datetime.date.today():
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            rotated = f"{self.baseFilename}.{datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.gz"
+            with open(self.baseFilename, 'rb') as source, gzip.open(rotated, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(self.baseFilename)
+        self.opened_on = datetime.date.today()
+        self.expire_rotated()
+
+    def rotated_files(self):
+        """Return the rotated files of this log, oldest first."""
+        directory, name = os.path.split(self.baseFilename)
+        return sorted(os.path.join(directory, entry) for entry in os.listdir(directory)
+                      if entry.startswith(f"{name}.") and entry.endswith('.gz'))
+
+    def expire_rotated(self):
+        rotated = self.rotated_files()
+        expired = set()
+        if self.keep_files:
+            expired.update(rotated[:-self.keep_files])
+        if self.keep_days:
+            cutoff = time.time() - self.keep_days * 86400
+            expired.update(path for path in rotated if os.path.getmtime(path) < cutoff)
+        for path in expired:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def setup_logging():
+    """Send log records through a queue to a background thread that writes the log file and the console.
+
+    Workers only pay for putting a record on the queue. Returns the QueueListener, which is
+    stopped, flushing what is left, when the process exits.
+    """
+    log_dir = get_setting('log_dir') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    formatter = JsonFormatter() if get_setting('log_format', 'text') == 'json' else logging.Formatter(TEXT_FORMAT)
+
+    file_handler = CompressingRotatingFileHandler(
+        os.path.join(log_dir, LOG_FILE),
+        max_bytes=int(get_setting('log_max_mb', 10, float) * 1024 * 1024),
+        keep_days=get_setting('log_keep_days', 30, int),
+        keep_files=get_setting('log_keep_files', 0, int),
+    )
+    console_handler = logging.StreamHandler()
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # The project is a property of the thread that logs, so it must be attached before queueing
+    queue_handler.addFilter(ProjectContextFilter())
+    root = logging.getLogger()
+    root.setLevel(get_setting('log_level', 'DEBUG').upper())
+    root.handlers = [queue_handler]
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
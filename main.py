@@ -1,97 +1,337 @@
 import os
 import sys
+import time
+import queue
+import argparse
+import subprocess
 import datetime
 import logging
+import threading
 from autosave import autosave
 
 from utils import load_config
+import accounts
+import git_backend
 import git_operations
+import log_setup
+import metrics
+import scheduler
+import state
+import throttle
 
-# Set up logging
-log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, f'autosave_{datetime.datetime.now().strftime("%Y%m%d")}.log')
-
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
-)
-
-# Ensure the GITHUB_AUTOSAVE_CONFIG_FILE environment variable is set
-if 'GITHUB_AUTOSAVE_CONFIG_FILE' not in os.environ:
-    config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "autosave_config.txt")
-    os.environ['GITHUB_AUTOSAVE_CONFIG_FILE'] = config_file
-else:
-    config_file = os.environ['GITHUB_AUTOSAVE_CONFIG_FILE']
-
-# Verify that the config file exists
-if not os.path.exists(config_file):
-    logging.error(f"Config file not found: {config_file}")
-    raise FileNotFoundError(f"Config file not found: {config_file}")
+def locate_config_file():
+    """Point GITHUB_AUTOSAVE_CONFIG_FILE at the config file, defaulting to autosave_config.txt next to the scripts."""
+    if 'GITHUB_AUTOSAVE_CONFIG_FILE' not in os.environ:
+        config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "autosave_config.txt")
+        os.environ['GITHUB_AUTOSAVE_CONFIG_FILE'] = config_file
+    else:
+        config_file = os.environ['GITHUB_AUTOSAVE_CONFIG_FILE']
+
+    # Verify that the config file exists
+    if not os.path.exists(config_file):
+        logging.error("Config file not found: %s", config_file)
+        raise FileNotFoundError(f"Config file not found: {config_file}")
 
 def process_project(project_path, github_username, github_token, openai_key, bypass_check=False):
     """Process a single project directory, autosaving where necessary"""
-    
+    # Every step below shares one repository handle and its git processes
+    with git_backend.session(project_path):
+        _process_project(project_path, github_username, github_token, openai_key, bypass_check)
+
+def _process_project(project_path, github_username, github_token, openai_key, bypass_check):
     # Check if the project is a git repository
-    if git_operations.is_git_repo(project_path):
-        # If yes, attempt to match the local repository to a remote repository
-        remote_repo = git_operations.match_local_repo_to_remote_repo(project_path, github_username, github_token)
+    with metrics.span('classify'):
+        is_git_repo = git_operations.is_git_repo(project_path)
+        project_state = state.load_project(project_path)
+    if is_git_repo:
+        # If yes, reuse the match from an earlier run if it still holds, or attempt to match the local repository to a remote repository
+        remote_repo = git_operations.revalidate_remote_match(project_path, project_state) if project_state else None
+        if not remote_repo:
+            remote_repo = git_operations.match_local_repo_to_remote_repo(project_path, github_username, github_token)
         if remote_repo:
+            record_match(project_path)
             # If a match is found, commence autosaving
             autosave(project_path, openai_key, bypass_check)
         else:
             # If no match is found, create and initialize a new repository (no remote repo, but local repo exists)
-            git_operations.create_and_initialize_remote_repo(project_path, github_username, github_token)
+            with metrics.span('create_repo'):
+                git_operations.create_and_initialize_remote_repo(project_path, github_username, github_token)
+            record_match(project_path)
     else:
         # If no, attempt to match the local directory to a remote repository
         remote_repo = git_operations.match_local_dir_to_remote_repo(project_path, github_username, github_token)
         if remote_repo:
             # If a match is found, we'll need to reconcile the contents of the local directory with the remote repository
-            if git_operations.reconcile_local_dir_and_remote_repo(project_path, remote_repo, github_username, github_token):
+            with metrics.span('reconcile'):
+                reconciled = git_operations.reconcile_local_dir_and_remote_repo(project_path, remote_repo, github_username, github_token)
+            if reconciled:
                 autosave(project_path, openai_key, bypass_check)
         else:
             # If no match is found, create and initialize a new repository (no remote repo, no local repo)
-            git_operations.create_and_initialize_local_repo(project_path, github_username, github_token)
-            git_operations.create_and_initialize_remote_repo(project_path, github_username, github_token)
+            with metrics.span('create_repo'):
+                git_operations.create_and_initialize_local_repo(project_path, github_username, github_token)
+                git_operations.create_and_initialize_remote_repo(project_path, github_username, github_token)
+            record_match(project_path)
+
+def record_match(project_path):
+    """Record that a project is connected to its GitHub repository, so later runs can skip matching."""
+    # Matching may have renamed the project; only record the match if it is still here
+    if os.path.isdir(project_path):
+        state.save_project(project_path, classification='matched', **git_operations.describe_repo(project_path))
+
+def run_project(project_path, github_username, github_token, openai_key, bypass_check=False, autosave_only=False):
+    """Process one project, isolating its errors. Returns a (status, error, metrics) tuple.
+
+    With autosave_only the project is autosaved without being matched to GitHub again, as the
+    daemon does for projects it has already processed.
+    """
+    project = os.path.basename(project_path)
+    # Tagged with the full path, as projects in different roots can share a name
+    log_setup.set_project(project_path)
+    metrics.begin_project(project_path)
+    status, error = 'ok', None
+    try:
+        if not os.path.isdir(project_path):
+            logging.error("Project directory %s does not exist.", project_path)
+            status = 'skipped'
+        else:
+            logging.info("Processing project: %s", project)
+            if autosave_only:
+                autosave(project_path, openai_key, bypass_check)
+            else:
+                process_project(project_path, github_username, github_token, openai_key, bypass_check)
+            if os.path.isdir(project_path):
+                state.save_project(project_path, last_error=None)
+    except Exception as e:
+        logging.error("Error processing project %s: %s", project, e)
+        status, error = 'failed', str(e)
+        try:
+            state.save_project(project_path, last_error=error)
+        except Exception as state_error:
+            logging.error("Failed to record error for project %s: %s", project, state_error)
+    finally:
+        log_setup.set_project('-')
+    return status, error, metrics.end_project().as_dict()
+
+def run_projects(project_paths, github_username, github_token, openai_key, bypass_check=False, jobs=1, project_timeout=None, deadline=None, credentials=None):
+    """Process projects, in the given order, on a bounded pool of worker threads.
+
+    credentials maps project paths to the (username, token) of their GitHub account;
+    projects not in it use github_username and github_token.
+
+    A project running longer than project_timeout seconds is reported as failed and its
+    worker is replaced, so a hung repository cannot stall the rest of the sweep. Its git
+    commands are killed at the timeout so the worker unwinds through its cleanup, which is
+    waited for before returning. Projects
+    not started by the deadline (a time.monotonic() value) are reported as deferred.
+    Returns a dict mapping each project path to its status, error and wall time.
+    """
+    results = {}
+    pending = queue.Queue()
+    for project_path in project_paths:
+        pending.put(project_path)
+    running = {}
+    workers = {}
+    abandoned = set()
+    done = threading.Condition()
+
+    def worker():
+        while True:
+            try:
+                project_path = pending.get_nowait()
+            except queue.Empty:
+                return
+            if deadline is not None and time.monotonic() > deadline:
+                with done:
+                    results[project_path] = {'status': 'deferred', 'error': None, 'elapsed': 0.0, 'metrics': None}
+                    done.notify()
+                continue
+            started = time.monotonic()
+            with done:
+                running[project_path] = started
+                workers[project_path] = threading.current_thread()
+            username, token = (credentials or {}).get(project_path, (github_username, github_token))
+            throttle.set_deadline(started + project_timeout if project_timeout else None)
+            try:
+                status, error, project_metrics = run_project(project_path, username, token, openai_key, bypass_check)
+            finally:
+                throttle.set_deadline(None)
+            with done:
+                if project_path in abandoned:
+                    # A replacement worker has taken over; drop this late result and exit
+                    return
+                results[project_path] = {
+                    'status': status,
+                    'error': error,
+                    'elapsed': time.monotonic() - running.pop(project_path),
+                    'metrics': project_metrics,
+                }
+                done.notify()
+
+    def start_worker():
+        # Daemon threads so that a hung project cannot keep the process alive once the sweep ends
+        threading.Thread(target=worker, daemon=True).start()
+
+    for _ in range(max(1, min(jobs, len(project_paths)))):
+        start_worker()
+
+    with done:
+        while len(results) < len(project_paths):
+            done.wait(timeout=1)
+            if not project_timeout:
+                continue
+            now = time.monotonic()
+            for project_path, started in list(running.items()):
+                if now - started > project_timeout:
+                    logging.error("Project %s timed out after %s seconds.", project_path, project_timeout)
+                    del running[project_path]
+                    abandoned.add(project_path)
+                    results[project_path] = {
+                        'status': 'failed',
+                        'error': f"timed out after {project_timeout} seconds",
+                        'elapsed': now - started,
+                        'metrics': None,
+                    }
+                    start_worker()
+
+    # Leaving a stash-mode autosave half done would strand the user's changes in a stash; let it restore them
+    for project_path in abandoned:
+        workers[project_path].join(timeout=throttle.CLEANUP_SECONDS)
+        if workers[project_path].is_alive():
+            logging.error("Project %s is still running after timing out.", project_path)
+    return results
+
+def log_summary(results):
+    """Log the outcome and wall time of every project, followed by totals."""
+    counts = {'ok': 0, 'skipped': 0, 'failed': 0, 'deferred': 0}
+    for project_path, result in results.items():
+        counts[result['status']] += 1
+        message = f"{project_path}: {result['status']} in {result['elapsed']:.1f}s"
+        if result['error']:
+            message += f" ({result['error']})"
+        logging.info(message)
+    logging.info("Run summary: %s ok, %s skipped, %s failed, %s deferred", counts['ok'], counts['skipped'], counts['failed'], counts['deferred'])
+    phases = {}
+    for result in results.values():
+        for phase, seconds in ((result.get('metrics') or {}).get('phases') or {}).items():
+            phases[phase] = phases.get(phase, 0) + seconds
+    if phases:
+        logging.info("Time by phase: " + ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in sorted(phases.items(), key=lambda item: -item[1])))
+
+def parse_args(argv=None):
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(description="Autosave local projects to GitHub.")
+    parser.add_argument('projects', nargs='*', help="Project directory names to process (default: every entry in projects_dir)")
+    parser.add_argument('--bypass-check', action='store_true', help="Autosave even if no changes are older than the threshold")
+    parser.add_argument('--jobs', '-j', type=int, help="Number of projects to process in parallel (config key: jobs)")
+    parser.add_argument('--daemon', action='store_true', help="Keep running and autosave projects as their changes cross the threshold")
+    parser.add_argument('--budget-minutes', type=float, help="Stop starting new projects after this many minutes; the rest go first next time (config key: sweep_budget_minutes)")
+    parser.add_argument('--project-timeout', type=float, help="Seconds before a single project is abandoned (config key: project_timeout)")
+    parser.add_argument('--shard', help="Only process the projects of shard i/N, split by a hash of the project name (config key: shard)")
+    parser.add_argument('--plan', nargs='?', const='table', choices=('table', 'json'),
+                        help="Print what a sweep would do and cost, as a table or JSON, without changing anything")
+    parser.add_argument('--profile-startup', action='store_true', help="Report how long importing the autosave modules takes and exit")
+    return parser.parse_args(argv)
+
+def profile_startup(limit=15):
+    """Import main in fresh interpreters and print the startup time and the slowest imports."""
+    command = [sys.executable, '-c', 'import main']
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    start = time.monotonic()
+    subprocess.run(command, cwd=cwd, check=True)
+    elapsed = time.monotonic() - start
+    result = subprocess.run(command[:1] + ['-X', 'importtime'] + command[1:], cwd=cwd, capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        # Lines look like "import time: <self us> | <cumulative us> | <indented module name>"
+        fields = line.split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        imports.append((int(fields[1]), fields[2].strip()))
+    own = next((cumulative for cumulative, module in imports if module == 'main'), 0)
+    print(f"Interpreter start and import of main: {elapsed * 1000:.1f} ms, of which importing main: {own / 1000:.1f} ms")
+    print("Slowest imports (cumulative):")
+    for cumulative, module in sorted(imports, reverse=True)[:limit]:
+        print(f"{cumulative / 1000:8.1f} ms  {module}")
 
 def main():
     """Main function to load config and process all projects or a specific project."""
+    args = parse_args()
+    if args.profile_startup:
+        profile_startup()
+        return
+    locate_config_file()
+    log_setup.setup_logging()
     try:
         config = load_config()
     except Exception as e:
-        logging.error(f"Failed to load configuration: {e}")
+        logging.error("Failed to load configuration: %s", e)
         sys.exit(1)
 
-    projects_dir = config['projects_dir']
+    try:
+        github_accounts = accounts.load_accounts(config)
+        assign_account = accounts.make_assigner(github_accounts, config.get('token_assignment', 'owner'))
+        shard = accounts.parse_shard(args.shard or config.get('shard'))
+    except (KeyError, ValueError) as e:
+        logging.error("Invalid configuration: %s", e)
+        sys.exit(1)
+    roots = accounts.project_roots(config, github_accounts)
     github_username = config['github_username']
     github_token = config['github_token']
     openai_key = config.get('openai_key', '')
+    jobs = args.jobs or config.getint('jobs', fallback=1)
+    project_timeout = args.project_timeout if args.project_timeout is not None else config.getfloat('project_timeout', fallback=3600)
 
-    projects = []
-    bypass_check = False
-    if '--bypass-check' in sys.argv:
-        bypass_check = True
-        sys.argv.remove('--bypass-check')
+    # Never let git block a worker waiting for credentials on a terminal nobody is watching
+    os.environ.setdefault('GIT_TERMINAL_PROMPT', '0')
+    throttle.install()
 
-    if len(sys.argv) > 1:
-        projects = sys.argv[1:]
+    if args.daemon:
+        from daemon import run_daemon
+        def process(project_path, autosave_only=False):
+            account = assign_account(project_path)
+            return run_project(project_path, account['username'], account['token'], openai_key, autosave_only=autosave_only)
+
+        run_daemon(
+            roots,
+            process,
+            lambda project_path: process(project_path, autosave_only=True),
+            include=lambda project_path: accounts.in_shard(project_path, shard),
+        )
+        return
+
+    started_at = datetime.datetime.now()
+    start = time.monotonic()
+    if args.projects:
+        project_paths = accounts.resolve_projects(roots, args.projects)
     else:
-        projects = os.listdir(projects_dir)
+        project_paths = [path for path in accounts.list_projects(roots) if accounts.in_shard(path, shard)]
 
-    for project in projects:
-        project_path = os.path.join(projects_dir, project)
-        if os.path.isdir(project_path):
-            logging.info(f"Processing project: {project}")
-            try:
-                process_project(project_path, github_username, github_token, openai_key, bypass_check)
-            except Exception as e:
-                logging.error(f"Error processing project {project}: {e}")
-        else:
-            logging.error(f"Project directory {project_path} does not exist.")
+    if args.plan:
+        import planner
+        plan = planner.plan_sweep(project_paths, assign_account, openai_key, args.bypass_check, jobs, started_at)
+        planner.print_plan(plan, args.plan)
+        return
+
+    if not args.projects:
+        # Most urgent projects first, so an overrunning sweep drops the least urgent ones
+        project_paths = scheduler.prioritize(project_paths, started_at, jobs)
+    # Assign in a stable order, so round-robin gives a project the same account from run to run
+    credentials = {}
+    for project_path in sorted(project_paths):
+        account = assign_account(project_path)
+        credentials[project_path] = (account['username'], account['token'])
+
+    budget_minutes = args.budget_minutes if args.budget_minutes is not None else config.getfloat('sweep_budget_minutes', fallback=0)
+    deadline = start + budget_minutes * 60 if budget_minutes else None
+    results = run_projects(project_paths, github_username, github_token, openai_key, args.bypass_check, jobs, project_timeout, deadline, credentials)
+    log_summary(results)
+    scheduler.record_carryover(results)
+
+    report = metrics.build_report(results, started_at, time.monotonic() - start)
+    metrics.write_report(report)
+    if config.get('metrics_textfile'):
+        metrics.write_textfile(report, config['metrics_textfile'])
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
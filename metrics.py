@@ -0,0 +1,144 @@
+import os
+import time
+import logging
+import datetime
+import threading
+import contextlib
+from collections import defaultdict
+
+from utils import get_setting, write_json_atomic
+
+_local = threading.local()
+
+class ProjectMetrics:
+    """Time spent per phase and counters collected while processing one project."""
+
+    def __init__(self, project):
+        self.project = project
+        self.phases = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    def as_dict(self):
+        return {
+            'phases': {phase: round(seconds, 4) for phase, seconds in self.phases.items()},
+            'counters': dict(self.counters),
+        }
+
+def begin_project(project):
+    """Start collecting metrics for a project on the current thread."""
+    _local.current = ProjectMetrics(project)
+    return _local.current
+
+def end_project():
+    """Stop collecting metrics on the current thread and return what was collected."""
+    metrics = getattr(_local, 'current', None)
+    _local.current = None
+    return metrics
+
+@contextlib.contextmanager
+def span(phase):
+    """Add the wall time of the enclosed block to a phase of the current project."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = getattr(_local, 'current', None)
+        if metrics is not None:
+            metrics.phases[phase] += time.perf_counter() - start
+
+def incr(counter, value=1):
+    """Add to a counter of the current project."""
+    metrics = getattr(_local, 'current', None)
+    if metrics is not None:
+        metrics.counters[counter] += value
+
+def build_report(results, started_at, duration):
+    """Assemble the per-run report from run_projects results.
+
+    Projects are keyed by path, since several project roots can hold projects of the same name.
+    """
+    phases = defaultdict(float)
+    counters = defaultdict(int)
+    statuses = defaultdict(int)
+    projects = {}
+    for project_path, result in results.items():
+        project_metrics = result.get('metrics') or {'phases': {}, 'counters': {}}
+        for phase, seconds in project_metrics['phases'].items():
+            phases[phase] += seconds
+        for counter, value in project_metrics['counters'].items():
+            counters[counter] += value
+        statuses[result['status']] += 1
+        projects[project_path] = {
+            'project': os.path.basename(project_path),
+            'root': os.path.dirname(project_path),
+            'status': result['status'],
+            'error': result['error'],
+            'elapsed': round(result['elapsed'], 4),
+            **project_metrics,
+        }
+    return {
+        'started_at': started_at.isoformat(),
+        'duration_seconds': round(duration, 4),
+        'statuses': dict(statuses),
+        'phases': {phase: round(seconds, 4) for phase, seconds in phases.items()},
+        'counters': dict(counters),
+        'projects': projects,
+    }
+
+def write_report(report):
+    """Write the JSON run report, keeping only the most recent metrics_keep_reports reports."""
+    report_dir = get_setting('metrics_dir') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+    os.makedirs(report_dir, exist_ok=True)
+    started_at = datetime.datetime.fromisoformat(report['started_at'])
+    path = os.path.join(report_dir, f"run_{started_at.strftime('%Y%m%d_%H%M%S')}.json")
+    write_json_atomic(path, report)
+    logging.debug("Wrote run report to %s", path)
+
+    keep = get_setting('metrics_keep_reports', 168, int)
+    reports = sorted(name for name in os.listdir(report_dir) if name.startswith('run_') and name.endswith('.json'))
+    for name in reports[:-keep] if keep > 0 else []:
+        os.remove(os.path.join(report_dir, name))
+    return path
+
+def write_textfile(report, path):
+    """Export the run report in the Prometheus text format, for node_exporter's textfile collector."""
+    lines = [
+        "# HELP autosave_last_run_timestamp_seconds Time the last autosave sweep started.",
+        "# TYPE autosave_last_run_timestamp_seconds gauge",
+        f"autosave_last_run_timestamp_seconds {datetime.datetime.fromisoformat(report['started_at']).timestamp()}",
+        "# HELP autosave_run_duration_seconds Wall time of the last autosave sweep.",
+        "# TYPE autosave_run_duration_seconds gauge",
+        f"autosave_run_duration_seconds {report['duration_seconds']}",
+        "# HELP autosave_projects Projects in the last sweep by outcome.",
+        "# TYPE autosave_projects gauge",
+    ]
+    for status in ('ok', 'skipped', 'failed', 'deferred'):
+        lines.append(f'autosave_projects{{status="{status}"}} {report["statuses"].get(status, 0)}')
+    lines += [
+        "# HELP autosave_phase_seconds Time spent in each phase during the last sweep, summed over projects.",
+        "# TYPE autosave_phase_seconds gauge",
+    ]
+    for phase, seconds in sorted(report['phases'].items()):
+        lines.append(f'autosave_phase_seconds{{phase="{phase}"}} {seconds}')
+    lines += [
+        "# HELP autosave_events Counted events during the last sweep, summed over projects.",
+        "# TYPE autosave_events gauge",
+    ]
+    for counter, value in sorted(report['counters'].items()):
+        lines.append(f'autosave_events{{event="{counter}"}} {value}')
+    lines += [
+        "# HELP autosave_project_seconds Wall time per project during the last sweep.",
+        "# TYPE autosave_project_seconds gauge",
+    ]
+    for _, result in sorted(report['projects'].items()):
+        lines.append(f'autosave_project_seconds{{project="{_escape(result["project"])}",root="{_escape(result["root"])}",'
+                     f'status="{result["status"]}"}} {result["elapsed"]}')
+
+    # Write then rename, so the collector never reads a half-written file
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(temp_path, path)
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
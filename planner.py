@@ -0,0 +1,212 @@
+import os
+import json
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import state
+import autosave
+import retention
+import git_backend
+import git_operations
+from repo_index import cached_repo_index
+from change_detection import scan_changes, get_threshold
+from snapshot_policy import get_policy, hold_back_reason
+from utils import get_setting
+
+COST_FIELDS = ('github_api_calls', 'fetches', 'pushes', 'push_bytes', 'files_changed', 'branches_pruned', 'openai_calls')
+TABLE_COLUMNS = (('project', 'Project'), ('account', 'Account'), ('action', 'Action'), ('autosave', 'Autosave'),
+                 ('files_changed', 'Files'), ('push_bytes', 'Push'), ('github_api_calls', 'API'), ('reason', 'Reason'))
+
+def plan_sweep(project_paths, assign_account, openai_key='', bypass_check=False, jobs=1, now=None):
+    """Work out what a sweep would do to every project and what it would cost, without changing anything.
+
+    Matching follows process_project and the autosave decision follows autosave.get_changes,
+    but only the state store, the cached repository index and local git commands are read:
+    nothing is fetched, written or sent to GitHub. Returns {'generated_at', 'projects', 'totals'}.
+    """
+    now = now or datetime.datetime.now()
+    accounts = {project_path: assign_account(project_path) for project_path in sorted(project_paths)}
+    indexes = {}
+    for account in accounts.values():
+        if account['name'] not in indexes:
+            indexes[account['name']] = cached_repo_index(account['username'], account['token'])
+
+    def plan(project_path):
+        account = accounts[project_path]
+        try:
+            return plan_project(project_path, account, indexes[account['name']][0], now, openai_key, bypass_check)
+        except Exception as e:
+            logging.debug("Could not plan project %s: %s", project_path, e)
+            return new_entry(project_path, account, 'unknown', f"error: {e}")
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        projects = list(executor.map(plan, project_paths))
+
+    totals = {field: sum(entry[field] for entry in projects) for field in COST_FIELDS}
+    # A stale or missing repository index is listed again, one call per page, before plain directories are matched
+    for name, (index, pages, fresh) in indexes.items():
+        if not fresh and any(entry['account'] == name and not entry['git_repo'] for entry in projects):
+            totals['github_api_calls'] += max(pages, 1)
+    totals['actions'] = {}
+    for entry in projects:
+        totals['actions'][entry['action']] = totals['actions'].get(entry['action'], 0) + 1
+    totals['autosaves'] = sum(1 for entry in projects if entry['autosave'])
+    return {'generated_at': now.isoformat(), 'projects': projects, 'totals': totals}
+
+def new_entry(project_path, account, action, reason=''):
+    entry = {'project': os.path.basename(project_path), 'path': project_path, 'account': account['name'],
+             'action': action, 'git_repo': False, 'autosave': False, 'reason': reason}
+    entry.update(dict.fromkeys(COST_FIELDS, 0))
+    return entry
+
+def plan_project(project_path, account, repo_index, now, openai_key='', bypass_check=False):
+    """Return the plan of one project: the action process_project would take, whether it autosaves, and its cost.
+
+    Actions are 'matched' (already connected to GitHub), 'rename' (history unrelated to origin, so
+    the directory is renamed and pushed as a new repository), 'create_remote', 'reconcile'
+    (a plain directory matching a GitHub repository), 'create' and 'skip'.
+    """
+    if not os.path.isdir(project_path):
+        return new_entry(project_path, account, 'skip', "directory does not exist")
+    with git_backend.session(project_path):
+        if not git_operations.is_git_repo(project_path):
+            return plan_directory(project_path, account, repo_index)
+        repo = git_backend.open_repo(project_path)
+        # Keep git status from refreshing the index, the one write it would otherwise make
+        with repo.git.custom_environment(GIT_OPTIONAL_LOCKS='0'):
+            entry = plan_match(repo, account, state.load_project(project_path, read_only=True), repo_index)
+            if entry['action'] in ('matched', 'rename'):
+                plan_autosave(repo, entry, now, openai_key, bypass_check)
+        return entry
+
+def plan_directory(project_path, account, repo_index):
+    """Plan a directory that is not a repository yet, as match_local_dir_to_remote_repo would match it."""
+    remote = repo_index.get(os.path.basename(project_path).lower()) if repo_index is not None else None
+    if remote:
+        # The reconciled directory is autosaved by the same run; its size bounds what that pushes
+        entry = new_entry(project_path, account, 'reconcile', f"matches {remote['html_url']}")
+        entry.update(fetches=1, autosave=True, pushes=1)
+    else:
+        reason = "no repository of that name" if repo_index is not None else "no cached repository index, assuming no match"
+        entry = new_entry(project_path, account, 'create', reason)
+        entry.update(github_api_calls=1, pushes=1)
+    entry['files_changed'], entry['push_bytes'] = directory_size(project_path)
+    return entry
+
+def plan_match(repo, account, project_state, repo_index):
+    """Plan how a repository is matched to GitHub, as revalidate_remote_match and match_local_repo_to_remote_repo would."""
+    entry = new_entry(repo.working_dir, account, 'matched')
+    entry['git_repo'] = True
+    origin = repo.remotes.origin.url if 'origin' in repo.remotes else None
+    try:
+        head = repo.head.commit.hexsha
+    except ValueError:
+        head = None
+    tips = set(git_backend.session_for(repo).remote_tips().values())
+
+    if origin is None or 'github.com' not in origin:
+        # The remote is created, or retried under a new name if one already exists, and HEAD pushed to it
+        name_taken = repo_index is not None and os.path.basename(repo.working_dir).lower() in repo_index
+        entry.update(action='create_remote', reason="no GitHub origin", github_api_calls=1 + name_taken, pushes=1,
+                     push_bytes=history_size(repo, head))
+        return entry
+
+    # Every matched repository is fetched; fetch_mode 'changed' costs an ls-remote when nothing moved
+    entry['fetches'] = 1
+    if project_state and project_state['classification'] == 'matched' and project_state['remote_url'] == origin:
+        if head == project_state['head'] or shares_history(repo, head, tips):
+            entry['reason'] = "recorded match"
+            return entry
+
+    # Not known to match: the repository is looked up on GitHub
+    entry['github_api_calls'] = 1
+    if not tips:
+        entry.update(action='create_remote', reason="origin has no branches", github_api_calls=2, pushes=1,
+                     push_bytes=history_size(repo, head))
+    elif head and shares_history(repo, head, tips):
+        entry['reason'] = "shares history with origin"
+    else:
+        # At least one more lookup to find a free name, then HEAD is pushed to the new repository
+        entry.update(action='rename', reason="no history shared with origin", github_api_calls=2, pushes=1,
+                     push_bytes=history_size(repo, head))
+    return entry
+
+def plan_autosave(repo, entry, now, openai_key='', bypass_check=False):
+    """Add the autosave autosave() would make to a plan entry: changed files, push size and pruned branches."""
+    changes = [change for change in scan_changes(repo) if not change['saved']]
+    threshold = get_threshold()
+    due = [change for change in changes if now - change['modified'] >= threshold]
+    if not due and not bypass_check:
+        return
+    policy = get_policy()
+    committed = [change for change in changes
+                 if not hold_back_reason(change['path'], os.path.join(repo.working_dir, change['path']), change['size'], policy)]
+    current_branch = git_backend.session_for(repo).current_branch()
+    # The current branch and branches without an upstream are pushed along with the autosave branch
+    branches = autosave.untracked_branches(repo, current_branch) + ([current_branch] if current_branch else [])
+    entry.update(autosave=True, files_changed=len(changes), pushes=entry['pushes'] + 1,
+                 push_bytes=entry['push_bytes'] + sum(change['size'] for change in committed) + autosave.estimate_push_size(repo, branches))
+    if openai_key:
+        entry['openai_calls'] = 1
+
+    keep_days = get_setting('autosave_keep_days', 0, int)
+    keep_count = get_setting('autosave_keep_count', 0, int)
+    if keep_days or keep_count:
+        # Counting the autosave branch about to be created is left out; at most it expires one more
+        branches = retention.autosave_branches(repo)
+        expired = retention.expired_autosave_branches(branches, now, keep_days, keep_count)
+        entry['branches_pruned'] = len(expired)
+        if any(branches[name]['remote'] for name in expired):
+            entry['pushes'] += 1
+
+def shares_history(repo, head, tips):
+    """Check whether HEAD shares history with any remote tip, reading but never writing the ancestry cache."""
+    return bool(head) and any(git_operations.shares_history(repo, head, tip, write_cache=False) for tip in tips)
+
+def history_size(repo, head):
+    """Return the on-disk size of everything reachable from HEAD, which a push to a new repository sends."""
+    if not head:
+        return 0
+    status, output, _ = repo.git.rev_list('--objects', '--disk-usage', head, with_extended_output=True, with_exceptions=False)
+    return int(output) if status == 0 and output.strip().isdigit() else 0
+
+def directory_size(path):
+    """Return (number of files, total bytes) under a directory, leaving out any .git directory."""
+    files, size = 0, 0
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [name for name in dirs if name != '.git']
+        for name in names:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+                files += 1
+            except OSError:
+                pass
+    return files, size
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+def format_table(plan):
+    """Render a plan as a text table, one row per project followed by the totals."""
+    rows = []
+    for entry in plan['projects']:
+        row = dict(entry, autosave='yes' if entry['autosave'] else '', push_bytes=format_bytes(entry['push_bytes']))
+        rows.append([str(row[key]) for key, _ in TABLE_COLUMNS])
+    headers = [title for _, title in TABLE_COLUMNS]
+    widths = [max(len(cell) for cell in column) for column in zip(headers, *rows)]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() for line in [headers] + rows]
+    totals = plan['totals']
+    lines.append('')
+    lines.append("Actions: " + ', '.join(f"{count} {action}" for action, count in sorted(totals['actions'].items())))
+    lines.append(f"Autosaves: {totals['autosaves']}, files changed: {totals['files_changed']}, "
+                 f"fetches: {totals['fetches']}, pushes: {totals['pushes']} ({format_bytes(totals['push_bytes'])}), "
+                 f"GitHub API calls: {totals['github_api_calls']}, OpenAI calls: {totals['openai_calls']}, "
+                 f"autosave branches pruned: {totals['branches_pruned']}")
+    return '\n'.join(lines)
+
+def print_plan(plan, output_format='table'):
+    print(json.dumps(plan, indent=2) if output_format == 'json' else format_table(plan))
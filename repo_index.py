@@ -0,0 +1,159 @@
+import time
+import hashlib
+import logging
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from github_client import get_client, get_async_client
+from utils import get_setting, read_json_cache, write_json_cache
+
+_indexes = {}
+# One lock per token, so building one account's index does not hold up the others
+_token_locks = {}
+_lock = threading.Lock()
+
+def _token_lock(github_token):
+    with _lock:
+        return _token_locks.setdefault(github_token, threading.Lock())
+
+def get_repo_index(github_username, github_token):
+    """Return a case-insensitive map of repository name to repository, built once per token and rebuilt every repo_index_ttl seconds.
+
+    The rebuild matters to the daemon, which would otherwise never see repositories created on GitHub after it started.
+    Raises RuntimeError, and keeps nothing, when the repositories can neither be listed nor read from the cache.
+    """
+    ttl = get_setting('repo_index_ttl', 3600, int)
+    with _token_lock(github_token):
+        built_at, index = _indexes.get(github_token, (None, None))
+        if index is None or time.monotonic() - built_at >= ttl:
+            index = build_repo_index(github_username, github_token)
+            _indexes[github_token] = (time.monotonic(), index)
+        return index
+
+def add_to_repo_index(github_token, repo):
+    """Record a repository created during this run so later lookups see it."""
+    with _token_lock(github_token):
+        if github_token in _indexes:
+            _indexes[github_token][1][repo['name'].lower()] = _summarize(repo)
+
+def index_cache_name(github_token):
+    """Return the name of the cache file holding the repository index of a token."""
+    return f"repo_index_{hashlib.sha256(github_token.encode()).hexdigest()[:16]}.json"
+
+def build_repo_index(github_username, github_token):
+    """Build the repository index from the on-disk cache, revalidating it with the API once its TTL has expired."""
+    cached = read_json_cache(index_cache_name(github_token))
+    ttl = get_setting('repo_index_ttl', 3600, int)
+
+    if cached and time.time() - cached['fetched_at'] < ttl:
+        logging.debug("Using cached repository index for user %s.", github_username)
+        pages = cached['pages']
+    else:
+        pages = fetch_repo_pages(github_token, cached['pages'] if cached else [])
+        if pages is None:
+            # An empty index would make every directory look new, so only a stale one will do
+            if not cached:
+                raise RuntimeError(f"Could not list the repositories of {github_username} and none are cached")
+            pages = cached['pages']
+        else:
+            write_json_cache(index_cache_name(github_token), {'fetched_at': time.time(), 'pages': pages})
+    return index_pages(pages, github_username)
+
+def cached_repo_index(github_username, github_token):
+    """Return (index, number of pages, whether the cache is still fresh) from the on-disk cache only.
+
+    Never calls the API; the index is None when nothing has been cached for this token.
+    """
+    cached = read_json_cache(index_cache_name(github_token))
+    if not cached:
+        return None, 0, False
+    fresh = time.time() - cached['fetched_at'] < get_setting('repo_index_ttl', 3600, int)
+    return index_pages(cached['pages'], github_username), len(cached['pages']), fresh
+
+def index_pages(pages, github_username):
+    """Build a case-insensitive map of repository name to repository from pages of /user/repos."""
+    index = {}
+    for page in pages:
+        for repo in page['repos']:
+            name = repo['name'].lower()
+            # Prefer the user's own repository over same-named ones from organisations
+            if name not in index or repo['owner'] == github_username:
+                index[name] = repo
+    logging.debug("Repository index for user %s holds %s repositories.", github_username, len(index))
+    return index
+
+def fetch_repo_pages(github_token, cached_pages):
+    """Fetch every page of /user/repos.
+
+    When the first page's Link header names the last page, the remaining pages are requested
+    concurrently through the asyncio client; otherwise next links are followed one by one.
+    Pages seen before are revalidated with If-None-Match, so an unchanged listing costs
+    no rate limit budget. Returns None if the listing could not be fetched.
+    """
+    import asyncio
+    from requests import RequestException
+    client = get_client(github_token)
+    cached_by_url = {page['url']: page for page in cached_pages}
+
+    def fetch(url):
+        cached = cached_by_url.get(url)
+        return page_from_response(url, client.request('GET', url, headers=revalidation_headers(cached)), cached)
+
+    async def fetch_concurrently(urls):
+        async_client = get_async_client(github_token)
+
+        async def fetch_async(url):
+            cached = cached_by_url.get(url)
+            return page_from_response(url, await async_client.get(url, headers=revalidation_headers(cached)), cached)
+        return await asyncio.gather(*(fetch_async(url) for url in urls))
+
+    try:
+        pages = [fetch(client.url("user/repos?per_page=100"))]
+        last = pages[0] and pages[0].get('last')
+        if last and last_page_number(last):
+            pages += asyncio.run(fetch_concurrently([page_url(last, number) for number in range(2, last_page_number(last) + 1)]))
+        else:
+            while pages[-1] and pages[-1]['next']:
+                pages.append(fetch(pages[-1]['next']))
+    except RequestException as e:
+        logging.error("Failed to fetch repository list: %s", e)
+        return None
+    return None if None in pages else pages
+
+def revalidation_headers(cached):
+    return {'If-None-Match': cached['etag']} if cached and cached.get('etag') else {}
+
+def page_from_response(url, response, cached):
+    """Turn a response for one page of /user/repos into a page, or None if it failed."""
+    if response.status_code == 304 and cached:
+        return cached
+    if response.status_code != 200:
+        logging.error("Failed to fetch repository list page %s: %s", url, response.status_code)
+        return None
+    return {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'repos': [_summarize(repo) for repo in response.json()],
+        'next': response.links.get('next', {}).get('url'),
+        'last': response.links.get('last', {}).get('url'),
+    }
+
+def last_page_number(last_url):
+    """Return the page number of a 'last' pagination link, or None if it has none."""
+    page = dict(parse_qsl(urlsplit(last_url).query)).get('page', '')
+    return int(page) if page.isdigit() else None
+
+def page_url(last_url, number):
+    """Return the URL of a page of a paginated listing, built from its 'last' link."""
+    parts = urlsplit(last_url)
+    query = [(key, str(number) if key == 'page' else value) for key, value in parse_qsl(parts.query)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def _summarize(repo):
+    return {
+        'name': repo['name'],
+        'owner': repo['owner']['login'] if isinstance(repo.get('owner'), dict) else repo.get('owner'),
+        'html_url': repo['html_url'],
+        'clone_url': repo.get('clone_url'),
+        'default_branch': repo.get('default_branch'),
+    }
@@ -0,0 +1,88 @@
+import re
+import logging
+import datetime
+
+import metrics
+import throttle
+import git_backend
+from utils import get_setting
+
+# <branch>_<YYYYmmdd>_autosave_0, then <branch>_<YYYYmmdd>_autosave_0_<n> for later autosaves that day
+AUTOSAVE_BRANCH = re.compile(r'^(?P<branch>.+)_(?P<date>\d{8})_autosave_0(?:_(?P<increment>\d+))?$')
+
+def parse_autosave_branch(name):
+    """Return (source branch, date, increment) for an autosave branch name, or None for other branches."""
+    match = AUTOSAVE_BRANCH.match(name)
+    if not match:
+        return None
+    try:
+        date = datetime.datetime.strptime(match['date'], '%Y%m%d')
+    except ValueError:
+        return None
+    return match['branch'], date, int(match['increment'] or 0)
+
+def autosave_branches(repo):
+    """Return {name: {'branch', 'date', 'increment', 'local', 'remote'}} for the autosave branches known locally.
+
+    Remote branches are taken from the remote-tracking refs, which every fetch and push keeps current.
+    """
+    branches = {}
+    for refname in git_backend.session_for(repo).refs():
+        for prefix, where in (('refs/heads/', 'local'), ('refs/remotes/origin/', 'remote')):
+            if not refname.startswith(prefix):
+                continue
+            name = refname[len(prefix):]
+            parsed = parse_autosave_branch(name)
+            if parsed:
+                entry = branches.setdefault(name, dict(zip(('branch', 'date', 'increment'), parsed), local=False, remote=False))
+                entry[where] = True
+    return branches
+
+def expired_autosave_branches(branches, now, keep_days=0, keep_count=0):
+    """Return the autosave branches older than keep_days, or beyond the keep_count newest of their source branch."""
+    newest_first = sorted(branches, key=lambda name: (branches[name]['date'], branches[name]['increment']), reverse=True)
+    kept = {}
+    expired = []
+    for name in newest_first:
+        source = branches[name]['branch']
+        kept[source] = kept.get(source, 0) + 1
+        too_old = keep_days and (now - branches[name]['date']).days >= keep_days
+        too_many = keep_count and kept[source] > keep_count
+        if too_old or too_many:
+            expired.append(name)
+    return expired
+
+def prune_autosave_branches(repo, now=None):
+    """Delete expired autosave branches from origin in one push and locally in one command.
+
+    Retention is set with autosave_keep_days and autosave_keep_count (per source branch);
+    nothing is deleted when both are 0. Returns the names of the deleted branches.
+    """
+    keep_days = get_setting('autosave_keep_days', 0, int)
+    keep_count = get_setting('autosave_keep_count', 0, int)
+    if not keep_days and not keep_count:
+        return []
+    now = now or datetime.datetime.now()
+    branches = autosave_branches(repo)
+    current = git_backend.session_for(repo).current_branch()
+    expired = [name for name in expired_autosave_branches(branches, now, keep_days, keep_count) if name != current]
+    if not expired:
+        return []
+
+    with metrics.span('prune'):
+        remote = [name for name in expired if branches[name]['remote']]
+        if remote:
+            throttle.check_deadline("deleting expired autosave branches")
+            status, _, stderr = repo.git.push('--porcelain', 'origin', *[f':refs/heads/{name}' for name in remote],
+                                              with_extended_output=True, with_exceptions=False)
+            if status != 0:
+                # Keep the local copies so the remote deletion is retried next time
+                logging.error("Failed to delete expired autosave branches from origin: %s", stderr)
+                expired = [name for name in expired if not branches[name]['remote']]
+        local = [name for name in expired if branches[name]['local']]
+        if local:
+            repo.git.branch('-D', *local)
+        git_backend.invalidate(repo)
+    metrics.incr('autosave_branches_pruned', len(expired))
+    logging.info("Pruned %s expired autosave branches from %s.", len(expired), repo.working_dir)
+    return expired
@@ -0,0 +1,58 @@
+import os
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import git_backend
+import git_operations
+import state
+from change_detection import scan_changes
+
+def project_priority(project_path, now):
+    """Return a sort key for a project; smaller keys are processed first.
+
+    Projects carried over from an overrun sweep come first, the most often deferred ahead
+    of the rest. Then directories that are not yet repositories (they still need setting
+    up), then repositories by the age of their oldest unsaved change and the size of the
+    pending changes. Projects with nothing unsaved come last.
+    """
+    project_state = state.load_project(project_path) or {}
+    carryover = project_state.get('carryover') or 0
+    with git_backend.session(project_path):
+        if not git_operations.is_git_repo(project_path):
+            return (-carryover, 0, 0, 0)
+        unsaved = [change for change in scan_changes(git_backend.open_repo(project_path)) if not change['saved']]
+    if not unsaved:
+        return (-carryover, 2, 0, 0)
+    oldest = min(change['modified'] for change in unsaved)
+    pending_bytes = sum(change['size'] for change in unsaved)
+    return (-carryover, 1, -(now - oldest).total_seconds(), -pending_bytes)
+
+def prioritize(project_paths, now=None, jobs=1):
+    """Order projects so the ones whose unsaved work is most at risk are processed first.
+
+    Every project is scanned with git status, so the scans run on as many threads as the sweep itself.
+    """
+    now = now or datetime.datetime.now()
+
+    def priority(project_path):
+        try:
+            return project_priority(project_path, now)
+        except Exception as e:
+            logging.debug("Could not prioritize project %s: %s", project_path, e)
+            return (0, 1, 0, 0)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        priorities = dict(zip(project_paths, executor.map(priority, project_paths)))
+    return sorted(project_paths, key=lambda project_path: priorities[project_path])
+
+def record_carryover(results):
+    """Raise the priority of projects the sweep did not get to, and reset it for the others."""
+    for project_path, result in results.items():
+        if not os.path.isdir(project_path):
+            continue
+        if result['status'] == 'deferred':
+            carryover = (state.load_project(project_path) or {}).get('carryover') or 0
+            state.save_project(project_path, carryover=carryover + 1)
+        elif result['status'] != 'failed':
+            state.save_project(project_path, carryover=0)
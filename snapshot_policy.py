@@ -0,0 +1,158 @@
+import os
+import fnmatch
+import hashlib
+import logging
+import tempfile
+
+from utils import get_setting, get_cache_dir, read_json_file, write_json_atomic
+from change_detection import git_status, stat_signature
+
+MANIFEST_PATH = '.autosave-manifest.json'
+HASH_CACHE_FILE = 'autosave_manifest.json'
+CHUNK_SIZE = 1024 * 1024
+# Same heuristic as git: a NUL byte in the first 8000 bytes marks a file as binary
+BINARY_PROBE_SIZE = 8000
+
+def get_policy():
+    """Return the snapshot policy configured for this run."""
+    return {
+        'max_bytes': int(get_setting('snapshot_max_file_mb', 100, float) * 1024 * 1024),
+        'max_binary_bytes': int(get_setting('snapshot_max_binary_mb', 10, float) * 1024 * 1024),
+        'exclude': [pattern.strip() for pattern in get_setting('snapshot_exclude', '').split(',') if pattern.strip()],
+        'action': get_setting('snapshot_large_file_action', 'skip'),
+    }
+
+def get_store_dir():
+    """Return the local content store that large files are copied to when the policy action is 'store'."""
+    store_dir = get_setting('snapshot_store_dir') or os.path.join(get_cache_dir(), 'objects')
+    os.makedirs(store_dir, exist_ok=True)
+    return store_dir
+
+def is_binary(path):
+    """Return True if the start of the file contains a NUL byte."""
+    try:
+        with open(path, 'rb') as f:
+            return b'\0' in f.read(BINARY_PROBE_SIZE)
+    except OSError:
+        return False
+
+def hold_back_reason(path, full_path, size, policy):
+    """Return why a file must be left out of the snapshot, or None if it can be committed."""
+    name = os.path.basename(path)
+    for pattern in policy['exclude']:
+        if fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(name, pattern):
+            return 'excluded'
+    if size > policy['max_bytes']:
+        return 'too_large'
+    if size > policy['max_binary_bytes'] and is_binary(full_path):
+        return 'binary'
+    return None
+
+def hash_file(path, store_dir=None):
+    """Return the sha256 of a file, read in chunks so memory use is constant.
+
+    If store_dir is given the file is copied into it in the same pass, under its hash.
+    """
+    digest = hashlib.sha256()
+    temp = tempfile.NamedTemporaryFile(dir=store_dir, prefix='.tmp_', delete=False) if store_dir else None
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                if temp:
+                    temp.write(chunk)
+        sha = digest.hexdigest()
+        if temp:
+            temp.close()
+            object_path = os.path.join(store_dir, sha[:2], sha[2:])
+            if os.path.exists(object_path):
+                os.remove(temp.name)
+            else:
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                os.replace(temp.name, object_path)
+        return sha
+    except BaseException:
+        if temp:
+            temp.close()
+            if os.path.exists(temp.name):
+                os.remove(temp.name)
+        raise
+
+def held_back_files(repo, policy=None, status=None):
+    """Return manifest entries for the dirty files the policy keeps out of the snapshot.
+
+    Only changed and untracked files are examined. Hashes of files whose stat data is
+    unchanged since the last autosave are reused, so a large file is read once per change.
+    """
+    policy = policy or get_policy()
+    cache_path = os.path.join(repo.git_dir, HASH_CACHE_FILE)
+    cached = {entry['path']: entry for entry in (read_json_file(cache_path) or [])}
+    entries = []
+    for path, path_status in (git_status(repo) if status is None else status):
+        full_path = os.path.join(repo.working_dir, path)
+        signature = stat_signature(full_path)
+        if signature is None or not os.path.isfile(full_path):
+            continue
+        reason = hold_back_reason(path, full_path, signature[0], policy)
+        if not reason:
+            continue
+        action = 'store' if policy['action'] == 'store' and reason != 'excluded' else 'skip'
+        previous = cached.get(path)
+        if previous and previous['signature'] == signature and previous['action'] == action:
+            entries.append(previous)
+            continue
+        sha = hash_file(full_path, get_store_dir() if action == 'store' else None)
+        entries.append({
+            'path': path,
+            'status': path_status,
+            'size': signature[0],
+            'sha256': sha,
+            'reason': reason,
+            'action': action,
+            'signature': signature,
+        })
+        logging.info("Holding %s (%s bytes, %s) back from the autosave of %s.", path, signature[0], reason, repo.working_dir)
+    write_json_atomic(cache_path, entries)
+    return entries
+
+def exclude_pathspecs(entries):
+    """Return pathspecs that leave the held back files out of a git command."""
+    return [f':(exclude,literal){entry["path"]}' for entry in entries]
+
+def stage_snapshot(repo, env=None, status=None):
+    """Stage every change the policy allows, plus a manifest of the held back files, and return the manifest.
+
+    env is passed to git, so the snapshot can be staged into a private index. status, the
+    output of git_status, saves a second status call when the caller already has it.
+    """
+    entries = held_back_files(repo, status=status)
+    repo.git.add('-A', '--', '.', *exclude_pathspecs(entries), env=env)
+    if entries:
+        blob = write_manifest_blob(repo, entries)
+        repo.git.update_index('--add', '--cacheinfo', f'100644,{blob},{MANIFEST_PATH}', env=env)
+    return entries
+
+def write_manifest_blob(repo, entries):
+    """Store the manifest of held back files as a blob and return its hash."""
+    manifest = [{key: value for key, value in entry.items() if key != 'signature'} for entry in entries]
+    fd, path = tempfile.mkstemp(dir=repo.git_dir, prefix='autosave_manifest_')
+    os.close(fd)
+    try:
+        write_json_atomic(path, manifest)
+        return repo.git.hash_object('-w', path)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+def discard_held_back(repo, entries):
+    """Drop the held back files from the working tree of an autosave branch.
+
+    Used in stash mode after the autosave commit, so switching back to the original
+    branch and popping the stash, which still holds them, does not conflict.
+    """
+    if not entries:
+        return
+    repo.git.reset('--hard', '--quiet')
+    untracked = [entry for entry in entries if entry['status'] == '??']
+    if untracked:
+        repo.git.clean('-f', '-q', '--', *[f':(literal){entry["path"]}' for entry in untracked])
@@ -0,0 +1,124 @@
+import os
+import json
+import sqlite3
+import datetime
+import pathlib
+import threading
+import contextlib
+
+from utils import get_cache_dir, get_setting
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    path TEXT PRIMARY KEY,
+    classification TEXT,
+    remote_url TEXT,
+    head TEXT,
+    remote_tips TEXT,
+    last_autosave TEXT,
+    last_error TEXT,
+    carryover INTEGER DEFAULT 0,
+    autosave_counters TEXT,
+    updated_at TEXT
+)
+"""
+
+# Columns added after the first release, created on databases that predate them
+MIGRATIONS = {
+    'carryover': "ALTER TABLE projects ADD COLUMN carryover INTEGER DEFAULT 0",
+    'autosave_counters': "ALTER TABLE projects ADD COLUMN autosave_counters TEXT",
+}
+
+FIELDS = ('classification', 'remote_url', 'head', 'remote_tips', 'last_autosave', 'last_error', 'carryover', 'autosave_counters')
+
+# Fields stored as JSON text
+JSON_FIELDS = ('remote_tips', 'autosave_counters')
+
+# Databases whose schema this process has already created and migrated
+_prepared = set()
+_prepared_lock = threading.Lock()
+
+def get_db_path():
+    return get_setting('state_db') or os.path.join(get_cache_dir(create=False), 'state.db')
+
+@contextlib.contextmanager
+def connect(read_only=False):
+    """Open the state database. Connections are per call, so worker threads never share one.
+
+    A read-only connection neither creates the database nor upgrades its schema, and is None
+    when there is no database yet.
+    """
+    db_path = get_db_path()
+    if read_only:
+        if not os.path.exists(db_path):
+            yield None
+            return
+        # Without a write-ahead log there is nothing uncheckpointed, and immutable keeps SQLite from creating one
+        immutable = '' if os.path.exists(f"{db_path}-wal") else '&immutable=1'
+        connection = sqlite3.connect(f"{pathlib.Path(db_path).resolve().as_uri()}?mode=ro{immutable}", uri=True, timeout=30)
+        try:
+            connection.row_factory = sqlite3.Row
+            yield connection
+        finally:
+            connection.close()
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    connection = sqlite3.connect(db_path, timeout=30)
+    try:
+        connection.row_factory = sqlite3.Row
+        with _prepared_lock:
+            if db_path not in _prepared:
+                prepare(connection)
+                _prepared.add(db_path)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+def prepare(connection):
+    """Create the schema and apply migrations; the journal mode is stored in the database itself."""
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(SCHEMA)
+    columns = {row['name'] for row in connection.execute("PRAGMA table_info(projects)")}
+    for column, statement in MIGRATIONS.items():
+        if column not in columns:
+            connection.execute(statement)
+    connection.commit()
+
+def load_project(path, read_only=False):
+    """Return what earlier runs recorded about a project, or None if it has not been seen.
+
+    read_only leaves the database untouched, for dry runs and lookups outside a sweep.
+    """
+    with connect(read_only) as connection:
+        if connection is None:
+            return None
+        try:
+            row = connection.execute("SELECT * FROM projects WHERE path = ?", (os.path.abspath(path),)).fetchone()
+        except sqlite3.OperationalError:
+            # A read-only connection cannot create the table of a database no sweep has used yet
+            return None
+    if row is None:
+        return None
+    project = dict(row)
+    for field in JSON_FIELDS:
+        project[field] = json.loads(project[field]) if project.get(field) else {}
+    return project
+
+def save_project(path, **fields):
+    """Update the recorded fields of a project, leaving the others as they were."""
+    unknown = set(fields) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown project state fields: {', '.join(sorted(unknown))}")
+    for field in JSON_FIELDS:
+        if field in fields:
+            fields[field] = json.dumps(fields[field])
+    fields['updated_at'] = datetime.datetime.now().isoformat()
+    columns = ', '.join(fields)
+    placeholders = ', '.join('?' for _ in fields)
+    updates = ', '.join(f"{column} = excluded.{column}" for column in fields)
+    with connect() as connection:
+        connection.execute(
+            f"INSERT INTO projects (path, {columns}) VALUES (?, {placeholders}) ON CONFLICT(path) DO UPDATE SET {updates}",
+            (os.path.abspath(path), *fields.values()),
+        )
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import pytest
+
+# get_setting and load_config read the file named by GITHUB_AUTOSAVE_CONFIG_FILE, so point it at a throwaway one
+if 'GITHUB_AUTOSAVE_CONFIG_FILE' not in os.environ:
+    _config_dir = tempfile.mkdtemp(prefix='autosave_test_')
+    _config_file = os.path.join(_config_dir, 'autosave_config.txt')
+    with open(_config_file, 'w') as f:
+        f.write("[DEFAULT]\n")
+        f.write(f"projects_dir={_config_dir}\n")
+        f.write("github_username=dummy_user\n")
+        f.write("github_token=dummy_token\n")
+        f.write(f"cache_dir={os.path.join(_config_dir, 'cache')}\n")
+    os.environ['GITHUB_AUTOSAVE_CONFIG_FILE'] = _config_file
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    """Give every test its own project state database."""
+    monkeypatch.setattr('state.get_db_path', lambda: str(tmp_path / 'state.db'))
+
+
+def settings(**values):
+    """Stand in for get_setting, returning the given values and the fallback for everything else."""
+    return lambda key, fallback=None, cast=str: values.get(key, fallback)
+
+
+@pytest.fixture
+def git_identity(monkeypatch):
+    """Give git commits made by the tests an author and committer."""
+    for name in ('AUTHOR', 'COMMITTER'):
+        monkeypatch.setenv(f'GIT_{name}_NAME', 'Test')
+        monkeypatch.setenv(f'GIT_{name}_EMAIL', 'test@example.com')
+
+
+@pytest.fixture
+def project(tmp_path, git_identity):
+    """A repository at tmp_path/project with one commit on main, pushed to a bare origin at tmp_path/remote.git."""
+    from git import Repo
+    remote = Repo.init(tmp_path / "remote.git", bare=True, initial_branch='main')
+    repo = Repo.init(tmp_path / "project", initial_branch='main')
+    (tmp_path / "project" / "tracked.txt").write_text("one\n")
+    repo.git.add(A=True)
+    repo.index.commit("Initial commit")
+    repo.create_remote('origin', remote.git_dir)
+    repo.git.push('-u', 'origin', 'main')
+    return repo, remote
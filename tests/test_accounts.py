@@ -0,0 +1,64 @@
+import sys
+import os
+import configparser
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import accounts
+
+CONFIG = """
+[DEFAULT]
+projects_dir = /work/a, /work/b
+github_username = alice
+github_token = alice-token
+
+[account bob]
+github_username = bob
+github_token = bob-token
+owners = Acme
+roots = /work/bob
+"""
+
+def load(text=CONFIG):
+    parser = configparser.ConfigParser()
+    parser.read_string(text)
+    return parser['DEFAULT']
+
+def test_accounts_and_roots_are_read_from_config():
+    config = load()
+    github_accounts = accounts.load_accounts(config)
+
+    assert [(account['name'], account['token']) for account in github_accounts] == [('default', 'alice-token'), ('bob', 'bob-token')]
+    assert github_accounts[1]['owners'] == {'bob', 'acme'}
+    assert accounts.project_roots(config, github_accounts) == [os.path.abspath(path) for path in ('/work/a', '/work/b', '/work/bob')]
+
+def test_account_sections_do_not_inherit_credentials():
+    with pytest.raises(KeyError, match='github_token'):
+        accounts.load_accounts(load(CONFIG.replace("github_token = bob-token\n", "")))
+
+def test_projects_are_assigned_by_owner_then_root_then_default():
+    github_accounts = accounts.load_accounts(load())
+    owners = {'/work/a/tool': 'acme', '/work/a/own': 'alice', '/work/bob/new': None, '/work/a/new': None}
+    with patch('accounts.remote_owner', side_effect=owners.get):
+        assign = accounts.make_assigner(github_accounts)
+        assert {path: assign(path)['name'] for path in owners} == {
+            '/work/a/tool': 'bob', '/work/a/own': 'default', '/work/bob/new': 'bob', '/work/a/new': 'default'}
+
+        assign = accounts.make_assigner(github_accounts, 'round_robin')
+        assert [assign(path)['name'] for path in ('/work/a/x', '/work/a/y', '/work/a/z')] == ['default', 'bob', 'default']
+
+def test_shards_split_projects_deterministically():
+    paths = [f'/work/a/project{i}' for i in range(40)]
+    shards = [accounts.parse_shard(f'{i}/3') for i in range(3)]
+    members = [[path for path in paths if accounts.in_shard(path, shard)] for shard in shards]
+
+    assert sorted(sum(members, [])) == sorted(paths)
+    assert all(members)
+    # The split only depends on the project name, not on where the tree is mounted
+    assert accounts.in_shard('/mnt/other/project7', shards[0]) == ('/work/a/project7' in members[0])
+    for invalid in ('3/3', '1/0', 'x'):
+        with pytest.raises(ValueError):
+            accounts.parse_shard(invalid)
@@ -0,0 +1,270 @@
+import sys
+import os
+import time
+import json
+import hashlib
+from unittest.mock import patch
+from git import Repo
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from autosave import autosave, push_branches, was_pushed, find_common_ancestor
+from conftest import settings
+
+def test_snapshot_autosave_leaves_working_tree_alone(project):
+    repo, remote = project
+    work_dir = repo.working_dir
+    with open(os.path.join(work_dir, "tracked.txt"), "w") as f:
+        f.write("two\n")
+    with open(os.path.join(work_dir, "untracked.txt"), "w") as f:
+        f.write("new\n")
+    old = time.time() - 2 * 86400
+    for name in ("tracked.txt", "untracked.txt"):
+        os.utime(os.path.join(work_dir, name), (old, old))
+    stats_before = {name: os.stat(os.path.join(work_dir, name)).st_mtime_ns for name in ("tracked.txt", "untracked.txt")}
+    with open(os.path.join(repo.git_dir, "index"), "rb") as f:
+        index_before = f.read()
+
+    with patch('autosave.get_setting', side_effect=settings(autosave_mode='snapshot')), \
+         patch('autosave.generate_ai_message', return_value="Autosave message"):
+        autosave(work_dir, "dummy_key")
+
+    autosave_branches = [ref for ref in remote.git.for_each_ref('--format=%(refname:short)', 'refs/heads').split() if '_autosave_' in ref]
+    assert len(autosave_branches) == 1
+    assert remote.git.show(f"{autosave_branches[0]}:tracked.txt") == "two"
+    assert remote.git.show(f"{autosave_branches[0]}:untracked.txt") == "new"
+    assert remote.git.log('-1', '--format=%s', autosave_branches[0]) == "Autosave message"
+
+    assert repo.active_branch.name == 'main'
+    assert {name: os.stat(os.path.join(work_dir, name)).st_mtime_ns for name in stats_before} == stats_before
+    with open(os.path.join(repo.git_dir, "index"), "rb") as f:
+        assert f.read() == index_before
+    assert repo.git.stash('list') == ''
+
+def test_stash_autosave_restores_working_tree(project):
+    repo, remote = project
+    work_dir = repo.working_dir
+    with open(os.path.join(work_dir, "untracked.txt"), "w") as f:
+        f.write("new\n")
+
+    with patch('autosave.get_setting', side_effect=settings(autosave_mode='stash')), \
+         patch('autosave.generate_ai_message', return_value="Autosave message"):
+        autosave(work_dir, "dummy_key", bypass_check=True)
+
+    autosave_branches = [ref for ref in remote.git.for_each_ref('--format=%(refname:short)', 'refs/heads').split() if '_autosave_' in ref]
+    assert len(autosave_branches) == 1
+    assert remote.git.show(f"{autosave_branches[0]}:untracked.txt") == "new"
+    assert repo.active_branch.name == 'main'
+    with open(os.path.join(work_dir, "untracked.txt")) as f:
+        assert f.read() == "new\n"
+    assert repo.git.stash('list') == ''
+
+def test_stash_autosave_past_deadline_restores_without_pushing(project):
+    import throttle
+    repo, remote = project
+    work_dir = repo.working_dir
+    with open(os.path.join(work_dir, "tracked.txt"), "w") as f:
+        f.write("edited\n")
+
+    def time_out(*args):
+        # The project times out while its commit message is generated
+        throttle.set_deadline(time.monotonic() - 1)
+        return "Autosave message"
+
+    try:
+        with patch('autosave.get_setting', side_effect=settings(autosave_mode='stash')), \
+             patch('autosave.generate_ai_message', side_effect=time_out):
+            autosave(work_dir, "dummy_key", bypass_check=True)
+    finally:
+        throttle.set_deadline(None)
+
+    assert [ref for ref in remote.git.for_each_ref('--format=%(refname:short)', 'refs/heads').split() if '_autosave_' in ref] == []
+    assert repo.active_branch.name == 'main'
+    with open(os.path.join(work_dir, "tracked.txt")) as f:
+        assert f.read() == "edited\n"
+    assert repo.git.stash('list') == ''
+
+def test_autosave_without_changes_keeps_existing_stash(project):
+    repo, remote = project
+    work_dir = repo.working_dir
+    with open(os.path.join(work_dir, "tracked.txt"), "w") as f:
+        f.write("stashed by the user\n")
+    repo.git.stash()
+
+    autosave(work_dir, "dummy_key")
+
+    assert len(repo.git.stash('list').splitlines()) == 1
+
+def test_stash_autosave_of_clean_tree_keeps_existing_stash(project):
+    repo, remote = project
+    work_dir = repo.working_dir
+    with open(os.path.join(work_dir, "tracked.txt"), "w") as f:
+        f.write("stashed by the user\n")
+    repo.git.stash()
+
+    with patch('autosave.get_setting', side_effect=settings(autosave_mode='stash')):
+        autosave(work_dir, "dummy_key", bypass_check=True)
+
+    assert len(repo.git.stash('list').splitlines()) == 1
+    assert repo.git.status('--porcelain') == ''
+    assert not [ref for ref in remote.git.for_each_ref('--format=%(refname:short)', 'refs/heads').split() if '_autosave_' in ref]
+
+def test_push_branches_sends_all_refs_in_one_push(project):
+    repo, remote = project
+    repo.git.branch('feature')
+    repo.git.branch('other')
+
+    with patch.object(type(repo.git), 'execute', autospec=True, side_effect=type(repo.git).execute) as execute:
+        results = push_branches(repo, ['feature', 'other', 'main'], track=['feature'])
+
+    pushes = [call.args[1] for call in execute.call_args_list if call.args[1][1] == 'push']
+    assert len(pushes) == 1
+    assert results['refs/heads/feature'][0] == '*'
+    assert results['refs/heads/main'][0] == '='
+    assert was_pushed(results, 'other')
+    assert repo.branches['feature'].tracking_branch() is not None
+    assert repo.branches['other'].tracking_branch() is None
+
+def test_push_branches_keeps_existing_upstreams(project, tmp_path):
+    repo, remote = project
+    Repo.init(tmp_path / "upstream.git", bare=True)
+    repo.create_remote('upstream', str(tmp_path / "upstream.git"))
+    repo.git.push('-u', 'upstream', 'main')
+
+    results = push_branches(repo, ['main'])
+
+    assert was_pushed(results, 'main')
+    assert repo.git.config('branch.main.remote') == 'upstream'
+
+def test_push_branches_reports_rejected_refs(project, tmp_path):
+    repo, remote = project
+    other = Repo.clone_from(remote.git_dir, tmp_path / "other", branch="main")
+    (tmp_path / "other" / "tracked.txt").write_text("upstream change\n")
+    other.git.commit('-am', 'Upstream change')
+    other.git.push('origin', 'main')
+    (tmp_path / "project" / "tracked.txt").write_text("local change\n")
+    repo.git.commit('-am', 'Local change')
+    repo.git.branch('feature')
+
+    results = push_branches(repo, ['main', 'feature'])
+
+    assert not was_pushed(results, 'main')
+    assert was_pushed(results, 'feature')
+
+def test_snapshot_autosave_holds_back_large_files(project, tmp_path):
+    repo, remote = project
+    work_dir = repo.working_dir
+    with open(os.path.join(work_dir, "notes.txt"), "w") as f:
+        f.write("notes\n")
+    with open(os.path.join(work_dir, "dataset.bin"), "wb") as f:
+        f.write(b"\0" * 4096)
+    with open(os.path.join(work_dir, "build.log"), "w") as f:
+        f.write("log\n")
+
+    policy = settings(autosave_mode='snapshot', snapshot_max_binary_mb=0.001, snapshot_exclude='*.log',
+                      snapshot_large_file_action='store', snapshot_store_dir=str(tmp_path / "objects"))
+    with patch('autosave.get_setting', side_effect=policy), \
+         patch('snapshot_policy.get_setting', side_effect=policy), \
+         patch('autosave.generate_ai_message', return_value="Autosave message"):
+        autosave(work_dir, "dummy_key", bypass_check=True)
+
+    branch = next(ref for ref in remote.git.for_each_ref('--format=%(refname:short)', 'refs/heads').split() if '_autosave_' in ref)
+    files = remote.git.ls_tree('-r', '--name-only', branch).split('\n')
+    assert "notes.txt" in files
+    assert "dataset.bin" not in files and "build.log" not in files
+    manifest = {entry['path']: entry for entry in json.loads(remote.git.show(f"{branch}:.autosave-manifest.json"))}
+    assert manifest["dataset.bin"]['action'] == 'store'
+    assert manifest["build.log"]['action'] == 'skip'
+    sha = manifest["dataset.bin"]['sha256']
+    assert sha == hashlib.sha256(b"\0" * 4096).hexdigest()
+    assert (tmp_path / "objects" / sha[:2] / sha[2:]).read_bytes() == b"\0" * 4096
+
+def test_stash_autosave_restores_held_back_files(project):
+    repo, remote = project
+    work_dir = repo.working_dir
+    with open(os.path.join(work_dir, "notes.txt"), "w") as f:
+        f.write("notes\n")
+    with open(os.path.join(work_dir, "build.log"), "w") as f:
+        f.write("log\n")
+
+    policy = settings(autosave_mode='stash', snapshot_exclude='*.log')
+    with patch('autosave.get_setting', side_effect=policy), \
+         patch('snapshot_policy.get_setting', side_effect=policy), \
+         patch('autosave.generate_ai_message', return_value="Autosave message"):
+        autosave(work_dir, "dummy_key", bypass_check=True)
+
+    branch = next(ref for ref in remote.git.for_each_ref('--format=%(refname:short)', 'refs/heads').split() if '_autosave_' in ref)
+    files = remote.git.ls_tree('-r', '--name-only', branch).split('\n')
+    assert "notes.txt" in files and "build.log" not in files
+    assert repo.active_branch.name == 'main'
+    with open(os.path.join(work_dir, "build.log")) as f:
+        assert f.read() == "log\n"
+    assert repo.git.stash('list') == ''
+
+def test_find_common_ancestor_prefers_closest_upstream_base(project):
+    repo, remote = project
+    work_dir = repo.working_dir
+    base = repo.head.commit.hexsha
+    # A stale remote branch that forked from the first commit
+    repo.git.checkout('-b', 'stale')
+    with open(os.path.join(work_dir, "stale.txt"), "w") as f:
+        f.write("stale\n")
+    repo.git.add(A=True)
+    repo.index.commit("Stale work")
+    repo.git.push('origin', 'stale')
+    repo.git.checkout('main')
+    for name in ("second", "third"):
+        with open(os.path.join(work_dir, f"{name}.txt"), "w") as f:
+            f.write(f"{name}\n")
+        repo.git.add(A=True)
+        repo.index.commit(name)
+    repo.git.push('origin', 'main')
+    pushed = repo.head.commit.hexsha
+    with open(os.path.join(work_dir, "local.txt"), "w") as f:
+        f.write("local\n")
+    repo.git.add(A=True)
+    repo.index.commit("Local work")
+    repo.git.fetch('origin')
+
+    assert find_common_ancestor(repo, repo.active_branch).hexsha == pushed
+    with patch('autosave.closest_merge_base') as closest_merge_base:
+        assert find_common_ancestor(repo, repo.active_branch).hexsha == pushed
+    closest_merge_base.assert_not_called()
+
+    repo.git.branch('--unset-upstream')
+    repo.git.update_ref('-d', 'refs/remotes/origin/main')
+    assert find_common_ancestor(repo, repo.active_branch).hexsha == base
+
+def test_collapsed_autosaves_fast_forward_one_branch_per_day(project):
+    repo, remote = project
+    work_dir = repo.working_dir
+    policy = settings(autosave_mode='snapshot', autosave_collapse_daily=True)
+    for content in ("two\n", "three\n"):
+        with open(os.path.join(work_dir, "tracked.txt"), "w") as f:
+            f.write(content)
+        with patch('autosave.get_setting', side_effect=policy), \
+             patch('autosave.generate_ai_message', return_value="Autosave message"):
+            autosave(work_dir, "dummy_key", bypass_check=True)
+
+    autosave_branches = [ref for ref in remote.git.for_each_ref('--format=%(refname:short)', 'refs/heads').split() if '_autosave_' in ref]
+    assert len(autosave_branches) == 1
+    assert remote.git.show(f"{autosave_branches[0]}:tracked.txt") == "three"
+    assert remote.git.show(f"{autosave_branches[0]}~1:tracked.txt") == "two"
+
+def test_unchanged_working_tree_is_not_autosaved_again(project):
+    repo, remote = project
+    work_dir = repo.working_dir
+    with open(os.path.join(work_dir, "tracked.txt"), "w") as f:
+        f.write("two\n")
+
+    with patch('autosave.get_setting', side_effect=settings(autosave_mode='stash')), \
+         patch('autosave.generate_ai_message', return_value="Autosave message") as generate_ai_message:
+        autosave(work_dir, "dummy_key", bypass_check=True)
+        os.utime(os.path.join(work_dir, "tracked.txt"))
+        autosave(work_dir, "dummy_key", bypass_check=True)
+
+    assert generate_ai_message.call_count == 1
+    autosave_branches = [ref for ref in remote.git.for_each_ref('--format=%(refname:short)', 'refs/heads').split() if '_autosave_' in ref]
+    assert len(autosave_branches) == 1
+    with open(os.path.join(work_dir, "tracked.txt")) as f:
+        assert f.read() == "two\n"
@@ -0,0 +1,48 @@
+import sys
+import os
+import time
+import datetime
+import pytest
+from git import Repo
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from change_detection import get_changes, git_status, record_autosave
+
+def age(path, hours):
+    timestamp = time.time() - hours * 3600
+    os.utime(path, (timestamp, timestamp))
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = Repo.init(tmp_path)
+    (tmp_path / "tracked.txt").write_text("one\n")
+    repo.git.add(A=True)
+    repo.git.commit('-m', 'Initial commit', author='Test <test@example.com>', env={'GIT_COMMITTER_NAME': 'Test', 'GIT_COMMITTER_EMAIL': 'test@example.com'})
+    return repo
+
+def test_git_status_includes_untracked_files(repo, tmp_path):
+    (tmp_path / "tracked.txt").write_text("two\n")
+    (tmp_path / "sub dir").mkdir()
+    (tmp_path / "sub dir" / "new file.txt").write_text("new\n")
+
+    assert sorted(git_status(repo)) == [('sub dir/new file.txt', '??'), ('tracked.txt', '.M')]
+
+def test_only_changes_older_than_threshold_are_reported(repo, tmp_path):
+    (tmp_path / "tracked.txt").write_text("two\n")
+    (tmp_path / "untracked.txt").write_text("new\n")
+    age(tmp_path / "untracked.txt", 30)
+
+    assert get_changes(repo, datetime.datetime.now(), datetime.timedelta(hours=24)) == ['untracked.txt']
+    assert sorted(get_changes(repo, datetime.datetime.now(), datetime.timedelta(0))) == ['tracked.txt', 'untracked.txt']
+
+def test_changes_covered_by_last_autosave_are_skipped(repo, tmp_path):
+    (tmp_path / "untracked.txt").write_text("new\n")
+    age(tmp_path / "untracked.txt", 30)
+    record_autosave(repo, 'tree')
+
+    assert get_changes(repo, datetime.datetime.now(), datetime.timedelta(hours=24)) == []
+
+    (tmp_path / "untracked.txt").write_text("newer\n")
+    age(tmp_path / "untracked.txt", 30)
+    assert get_changes(repo, datetime.datetime.now(), datetime.timedelta(hours=24)) == ['untracked.txt']
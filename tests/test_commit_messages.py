@@ -0,0 +1,77 @@
+import sys
+import os
+import json
+import threading
+import pytest
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import commit_messages
+from commit_messages import generate_ai_message, summarize_diff
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.prompts.append(request['messages'][-1]['content'])
+        body = json.dumps({
+            'id': 'chatcmpl-test',
+            'object': 'chat.completion',
+            'created': 0,
+            'model': request['model'],
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': f" Message {len(self.server.prompts)} "}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def fake_openai(tmp_path):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenAIHandler)
+    server.prompts = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings = {'openai_base_url': f"http://127.0.0.1:{server.server_address[1]}/v1", 'cache_dir': str(tmp_path)}
+    getter = lambda key, fallback=None, cast=str: settings.get(key, fallback)
+    with patch('commit_messages.get_setting', side_effect=getter), patch('utils.get_setting', side_effect=getter):
+        commit_messages._clients.clear()
+        yield server
+    commit_messages._clients.clear()
+    server.shutdown()
+    server.server_close()
+
+def make_diff(path, lines):
+    body = ''.join(f"+line {index}\n" for index in range(lines))
+    return f"diff --git a/{path} b/{path}\n--- /dev/null\n+++ b/{path}\n@@ -0,0 +1,{lines} @@\n{body}"
+
+def test_summarize_diff_drops_lock_files_and_truncates():
+    diff = make_diff('package-lock.json', 5000) + make_diff('src/app.py', 5000) + "diff --git a/logo.png b/logo.png\nBinary files /dev/null and b/logo.png differ\n"
+
+    summary = summarize_diff(diff, max_tokens=500, ignore_patterns=['package-lock.json'])
+
+    assert len(summary) < 500 * commit_messages.CHARS_PER_TOKEN + 100
+    assert "package-lock.json | +5000 -0 (not shown)" in summary
+    assert "logo.png | binary" in summary
+    assert "+++ b/package-lock.json" not in summary
+    assert "+++ b/src/app.py" in summary
+    assert summary.endswith("... (truncated)\n")
+
+def test_message_is_cached_by_tree_hash(fake_openai):
+    diff = make_diff('src/app.py', 3)
+
+    assert generate_ai_message(diff, "dummy_key", "abc123") == "Message 1"
+    assert generate_ai_message(diff, "dummy_key", "abc123") == "Message 1"
+    assert len(fake_openai.prompts) == 1
+    assert "+line 2" in fake_openai.prompts[0]
+
+def test_missing_key_falls_back_without_request(fake_openai):
+    assert generate_ai_message(make_diff('src/app.py', 1), "").startswith("Autosave commit at ")
+    assert fake_openai.prompts == []
@@ -0,0 +1,87 @@
+import sys
+import os
+import time
+import queue
+import datetime
+from unittest.mock import patch
+from git import Repo
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import daemon
+from conftest import settings
+
+class FakeClock:
+    def __init__(self):
+        self.start = time.time()
+        self.elapsed = 0.0
+
+    def monotonic(self):
+        return self.elapsed
+
+    def time(self):
+        return self.start + self.elapsed
+
+class ScriptedEvents:
+    """Deliver (at, project path) events at fixed clock offsets, advancing the clock by every wait.
+
+    An event with path None stops the daemon, as Ctrl-C would.
+    """
+
+    def __init__(self, clock, script):
+        self.clock = clock
+        self.script = list(script)
+
+    def get(self, timeout=None):
+        at, path = self.script[0]
+        if timeout is not None and self.clock.elapsed + timeout < at:
+            self.clock.elapsed += timeout
+            raise queue.Empty
+        self.script.pop(0)
+        self.clock.elapsed = max(self.clock.elapsed, at)
+        if path is None:
+            raise KeyboardInterrupt
+        return path
+
+    def get_nowait(self):
+        raise queue.Empty
+
+def test_project_for_path():
+    root = os.path.join(os.sep, 'projects')
+    assert daemon.project_for_path(root, os.path.join(root, 'app', 'src', 'main.py')) == 'app'
+    assert daemon.project_for_path(root, os.fsencode(os.path.join(root, 'app'))) == 'app'
+    assert daemon.project_for_path(root, os.path.join(root, 'app', '.git', 'index')) is None
+    assert daemon.project_for_path(root, os.path.join(os.sep, 'elsewhere', 'file')) is None
+    assert daemon.project_for_path(root, root) is None
+    assert daemon.project_for_path(root, None) is None
+
+def test_run_daemon_debounces_and_retries(tmp_path):
+    root = tmp_path / "projects"
+    repo_path = str(root / "repo")
+    Repo.init(repo_path)
+    unsaved = root / "repo" / "notes.txt"
+    unsaved.write_text("draft\n")
+    old = time.time() - 2 * 3600
+    os.utime(unsaved, (old, old))
+    (root / "plain").mkdir()
+    (root / "other_shard").mkdir()
+
+    clock = FakeClock()
+    # Two edits in quick succession are handled once; the run stops at 150 seconds
+    events = ScriptedEvents(clock, [(1, repo_path), (2, repo_path), (150, None)])
+    processed, autosaved = [], []
+
+    with patch('daemon.get_setting', side_effect=settings(daemon_debounce_seconds=5, daemon_retry_seconds=100)), \
+         patch('daemon.get_threshold', return_value=datetime.timedelta(hours=1)):
+        daemon.run_daemon(
+            [str(root)],
+            processed.append,
+            lambda project_path: autosaved.append((project_path, clock.elapsed)),
+            include=lambda project_path: not project_path.endswith('other_shard'),
+            events=events,
+            clock=clock,
+        )
+
+    assert sorted(processed) == [str(root / "plain"), repo_path]
+    # At startup, after the debounced edits, and once more when the retry interval ran out
+    assert autosaved == [(repo_path, 0), (repo_path, 7), (repo_path, 107)]
@@ -1,11 +1,18 @@
 import sys
 import os
 import pytest
+import threading
+import time
+import datetime
 from unittest.mock import patch
+from git import Repo
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from main import process_project
+from main import process_project, run_projects
+import metrics
+import state
+import throttle
 
 @pytest.fixture
 def mock_git_operations():
@@ -49,4 +56,105 @@ def test_process_project_non_git_repo_without_remote(mock_git_operations):
     process_project("dummy_path", "dummy_user", "dummy_token", "dummy_key")
 
     mock_git_operations.create_and_initialize_local_repo.assert_called_once_with("dummy_path", "dummy_user", "dummy_token")
-    mock_git_operations.create_and_initialize_remote_repo.assert_called_once_with("dummy_path", "dummy_user", "dummy_token")
\ No newline at end of file
+    mock_git_operations.create_and_initialize_remote_repo.assert_called_once_with("dummy_path", "dummy_user", "dummy_token")
+
+def test_failed_fetch_does_not_create_a_new_repository(project):
+    from unittest.mock import Mock
+    from git.exc import GitCommandError
+    repo, _ = project
+    repo.git.remote('set-url', 'origin', 'https://github.com/dummy_user/project.git')
+    client = Mock()
+    client.get.return_value = Mock(status_code=200)
+
+    with patch('git_operations.get_client', return_value=client), \
+         patch('git_operations.fetch_origin', side_effect=GitCommandError(['git', 'fetch'], -9)), \
+         patch('git_operations.create_and_initialize_remote_repo') as create, \
+         pytest.raises(GitCommandError):
+        process_project(repo.working_dir, "dummy_user", "dummy_token", "dummy_key")
+
+    create.assert_not_called()
+    assert repo.remotes.origin.url == 'https://github.com/dummy_user/project.git'
+
+def test_run_projects_reports_status_per_project(tmp_path):
+    ok_path = tmp_path / "ok"
+    ok_path.mkdir()
+    failing_path = tmp_path / "failing"
+    failing_path.mkdir()
+    missing_path = tmp_path / "missing"
+
+    def fake_process_project(project_path, *args):
+        if project_path == str(failing_path):
+            raise RuntimeError("boom")
+
+    with patch('main.process_project', side_effect=fake_process_project):
+        results = run_projects([str(ok_path), str(failing_path), str(missing_path)], "dummy_user", "dummy_token", "dummy_key", jobs=2)
+
+    assert results[str(ok_path)]['status'] == 'ok'
+    assert results[str(failing_path)]['status'] == 'failed'
+    assert results[str(failing_path)]['error'] == 'boom'
+    assert results[str(missing_path)]['status'] == 'skipped'
+
+def test_run_projects_abandons_hung_project(tmp_path):
+    hung_path = tmp_path / "hung"
+    Repo.init(hung_path)
+    quick_path = tmp_path / "quick"
+    quick_path.mkdir()
+    cleaned_up = threading.Event()
+
+    def fake_process_project(project_path, *args):
+        if project_path == str(hung_path):
+            try:
+                Repo(project_path).git.execute(['sleep', '30'])
+            finally:
+                cleaned_up.set()
+
+    start = time.monotonic()
+    with patch('main.process_project', side_effect=fake_process_project), \
+         patch.object(Repo, 'GitCommandWrapperType', throttle.ThrottledGit):
+        results = run_projects([str(hung_path), str(quick_path)], "dummy_user", "dummy_token", "dummy_key", jobs=1, project_timeout=0.5)
+
+    assert results[str(hung_path)]['status'] == 'failed'
+    # Either the sweep gave up on the worker or the killed git command failed the project first
+    assert any(word in results[str(hung_path)]['error'] for word in ('timed out', 'Timeout'))
+    assert results[str(quick_path)]['status'] == 'ok'
+    # The hung git command was killed at the timeout and the worker unwound before run_projects returned
+    assert cleaned_up.is_set()
+    assert time.monotonic() - start < 10
+
+def test_run_report_collects_phases_and_counters(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    # Same name under another root
+    other_path = tmp_path / "other_root" / "project"
+    other_path.mkdir(parents=True)
+
+    def fake_process_project(project_path, *args):
+        with metrics.span('fetch'):
+            metrics.incr('github_api_calls', 2)
+
+    with patch('main.process_project', side_effect=fake_process_project):
+        results = run_projects([str(project_path), str(other_path)], "dummy_user", "dummy_token", "dummy_key")
+    report = metrics.build_report(results, datetime.datetime(2024, 1, 1), 1.5)
+    metrics.write_textfile(report, str(tmp_path / "autosave.prom"))
+
+    assert report['statuses'] == {'ok': 2}
+    assert report['counters'] == {'github_api_calls': 4}
+    assert 'fetch' in report['projects'][str(project_path)]['phases']
+    assert report['projects'][str(other_path)]['project'] == 'project'
+    textfile = (tmp_path / "autosave.prom").read_text()
+    assert 'autosave_events{event="github_api_calls"} 4' in textfile
+    assert 'autosave_projects{status="ok"} 2' in textfile
+    assert f'autosave_project_seconds{{project="project",root="{tmp_path / "other_root"}",status="ok"}}' in textfile
+    assert len([line for line in textfile.splitlines() if line.startswith('autosave_project_seconds{project="project"')]) == 2
+
+def test_process_project_reuses_recorded_match(tmp_path, mock_git_operations, mock_autosave):
+    state.save_project(str(tmp_path), classification='matched', remote_url='https://github.com/dummy_user/project.git')
+    mock_git_operations.is_git_repo.return_value = True
+    mock_git_operations.revalidate_remote_match.return_value = 'https://github.com/dummy_user/project.git'
+    mock_git_operations.describe_repo.return_value = {'remote_url': 'https://github.com/dummy_user/project.git', 'head': 'abc', 'remote_tips': {}}
+
+    process_project(str(tmp_path), "dummy_user", "dummy_token", "dummy_key")
+
+    mock_git_operations.match_local_repo_to_remote_repo.assert_not_called()
+    mock_autosave.assert_called_once_with(str(tmp_path), "dummy_key", False)
+    assert state.load_project(str(tmp_path))['head'] == 'abc'
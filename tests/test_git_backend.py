@@ -0,0 +1,31 @@
+import sys
+import os
+from unittest.mock import patch
+from git import Git
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import git_backend
+
+def test_session_reads_branches_upstreams_and_tips_in_one_call(project):
+    repo, _ = project
+    repo.git.remote('set-head', 'origin', 'main')
+    repo.git.branch('local-only')
+    session = git_backend.GitSession(repo)
+    with patch.object(Git, 'execute', autospec=True, side_effect=Git.execute) as execute:
+        branches = session.branches()
+        assert session.current_branch() == 'main'
+        assert session.remote_tips() == {'refs/remotes/origin/main': repo.head.commit.hexsha}
+        assert session.refs()['refs/remotes/origin/HEAD']['symref'] == 'refs/remotes/origin/main'
+    assert [call.args[1][1] for call in execute.call_args_list] == ['for-each-ref']
+    assert branches['main']['upstream'] == 'refs/remotes/origin/main'
+    assert branches['local-only']['upstream'] is None
+
+def test_session_block_shares_one_repo(project):
+    repo, _ = project
+    path = repo.working_dir
+    with git_backend.session(path):
+        shared = git_backend.open_repo(path)
+        assert git_backend.open_repo(path) is shared
+        assert git_backend.session_for(shared) is git_backend.get_session(path)
+    assert git_backend.open_repo(path) is not shared
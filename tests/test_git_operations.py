@@ -0,0 +1,96 @@
+import sys
+import os
+import pytest
+from unittest.mock import patch
+from git import Repo
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import git_operations
+from fetch_strategy import fetch_origin
+from utils import read_json_file
+
+@pytest.fixture
+def remote(tmp_path, git_identity):
+    source = Repo.init(tmp_path / "source", initial_branch='main')
+    (tmp_path / "source" / "same.txt").write_text("same\n")
+    (tmp_path / "source" / "edited.txt").write_text("remote version\n")
+    source.git.add(A=True)
+    source.index.commit("Initial commit")
+    remote = Repo.clone_from(source.working_dir, tmp_path / "remote.git", bare=True)
+    remote.git.config('uploadpack.allowFilter', 'true')
+    return f"file://{remote.git_dir}"
+
+def test_reconcile_keeps_local_files_in_place(tmp_path, remote):
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "same.txt").write_text("same\n")
+    (project / "edited.txt").write_text("local version\n")
+    (project / "local_only.txt").write_text("local\n")
+    stats_before = {path.name: (path.stat().st_ino, path.stat().st_mtime_ns) for path in project.iterdir()}
+
+    assert git_operations.reconcile_local_dir_and_remote_repo(str(project), remote, "dummy_user", "dummy_token")
+
+    repo = Repo(project)
+    assert {path.name: (path.stat().st_ino, path.stat().st_mtime_ns) for path in project.iterdir() if path.name != '.git'} == stats_before
+    assert repo.active_branch.name == 'main'
+    assert repo.active_branch.tracking_branch().name == 'origin/main'
+    assert repo.git.config('remote.origin.promisor') == 'true'
+    assert sorted(repo.git.status('--porcelain').splitlines()) == [' M edited.txt', '?? local_only.txt']
+
+def test_interrupted_reconcile_leaves_plain_directory(tmp_path, remote):
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "file.txt").write_text("local\n")
+
+    with patch('git.Git.reset', side_effect=RuntimeError("interrupted"), create=True):
+        assert not git_operations.reconcile_local_dir_and_remote_repo(str(project), remote, "dummy_user", "dummy_token")
+
+    assert sorted(os.listdir(project)) == ["file.txt"]
+    assert git_operations.reconcile_local_dir_and_remote_repo(str(project), remote, "dummy_user", "dummy_token")
+    assert git_operations.is_git_repo(str(project))
+
+def test_fetch_origin_only_fetches_moved_branches(tmp_path, remote):
+    source = Repo(tmp_path / "source")
+    source.git.push(remote, 'main:feature')
+    repo = Repo.clone_from(remote, tmp_path / "clone")
+
+    with patch.object(type(repo.git), 'execute', autospec=True, side_effect=type(repo.git).execute) as execute:
+        assert not fetch_origin(repo)
+    assert not [call for call in execute.call_args_list if call.args[1][1] == 'fetch']
+
+    (tmp_path / "source" / "same.txt").write_text("moved\n")
+    source.index.add(["same.txt"])
+    source.index.commit("Move feature")
+    source.git.push(remote, 'main:feature')
+
+    with patch.object(type(repo.git), 'execute', autospec=True, side_effect=type(repo.git).execute) as execute:
+        assert fetch_origin(repo)
+    fetches = [call.args[1] for call in execute.call_args_list if call.args[1][1] == 'fetch']
+    assert len(fetches) == 1
+    assert fetches[0][-1] == '+refs/heads/feature:refs/remotes/origin/feature'
+    assert repo.commit('origin/feature').hexsha == source.head.commit.hexsha
+
+def test_shares_history_caches_answers_for_the_current_head(project):
+    repo, _ = project
+    head = repo.head.commit.hexsha
+    # A root commit of the same tree has no history in common with HEAD
+    unrelated = repo.git.commit_tree(repo.head.commit.tree.hexsha, '-m', 'Unrelated')
+    cache_path = os.path.join(repo.git_dir, 'autosave_ancestry.json')
+
+    assert not git_operations.shares_history(repo, head, unrelated)
+    assert git_operations.shares_history(repo, head, head)
+    assert read_json_file(cache_path) == {f"{head}:{unrelated}": False, f"{head}:{head}": True}
+
+    with patch.object(type(repo.git), 'execute', autospec=True, side_effect=type(repo.git).execute) as execute:
+        assert not git_operations.shares_history(repo, head, unrelated)
+    assert not [call for call in execute.call_args_list if call.args[1][1] == 'merge-base']
+
+    with open(os.path.join(repo.working_dir, "tracked.txt"), 'a') as f:
+        f.write("two\n")
+    repo.index.add(["tracked.txt"])
+    moved = repo.index.commit("Move HEAD").hexsha
+
+    assert git_operations.shares_history(repo, moved, head)
+    # Answers for the previous HEAD are dropped once it moves
+    assert read_json_file(cache_path) == {f"{moved}:{head}": True}
@@ -0,0 +1,164 @@
+import sys
+import os
+import json
+import asyncio
+import threading
+import pytest
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from unittest.mock import patch
+from github_client import GitHubClient, AsyncGitHubClient
+from repo_index import build_repo_index, get_repo_index
+
+class StubGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        server.client_ports.add(self.client_address[1])
+        if self.path.startswith('/user/repos'):
+            self.send_repo_page()
+        elif self.path == '/rate-limited' and server.rate_limited_once:
+            server.rate_limited_once = False
+            self.send_json(403, {'message': 'You have exceeded a secondary rate limit'}, {'Retry-After': '0'})
+        elif self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_json(200, {'path': self.path}, {'ETag': '"v1"'})
+
+    def send_repo_page(self):
+        page = int(parse_qs(urlparse(self.path).query).get('page', ['1'])[0])
+        etag = f'"page{page}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        repos = [{'name': f"Project{page}_{index}", 'owner': {'login': 'user'}, 'html_url': f"https://github.com/user/Project{page}_{index}"} for index in range(2)]
+        headers = {'ETag': etag}
+        if page < 3:
+            base = f'http://127.0.0.1:{self.server.server_address[1]}/user/repos?per_page=100'
+            headers['Link'] = f'<{base}&page={page + 1}>; rel="next", <{base}&page=3>; rel="last"'
+        self.send_json(200, repos, headers)
+
+    def send_json(self, status, payload, headers):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubGitHubHandler)
+    server.requests = []
+    server.client_ports = set()
+    server.rate_limited_once = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client(stub_server):
+    return GitHubClient("dummy_token", api_url=f"http://127.0.0.1:{stub_server.server_address[1]}")
+
+def test_conditional_request_returns_cached_response(stub_server, client):
+    first = client.get("repos/user/project")
+    second = client.get("repos/user/project")
+
+    assert first.json() == {'path': '/repos/user/project'}
+    assert second is first
+    assert 'If-None-Match' not in stub_server.requests[0][1]
+    assert stub_server.requests[1][1]['If-None-Match'] == '"v1"'
+    assert stub_server.requests[0][1]['Authorization'] == 'token dummy_token'
+
+def test_connections_are_reused(stub_server, client):
+    for index in range(5):
+        client.get(f"repos/user/project_{index}")
+
+    assert len(stub_server.client_ports) == 1
+
+def test_secondary_rate_limit_is_retried(stub_server, client):
+    response = client.get("rate-limited")
+
+    assert response.status_code == 200
+    assert len(stub_server.requests) == 2
+
+def test_async_client_fetches_concurrently(stub_server, client):
+    async_client = AsyncGitHubClient(client, concurrency=4)
+    responses = asyncio.run(async_client.get_many([f"repos/user/project_{index}" for index in range(8)]))
+
+    assert [response.json()['path'] for response in responses] == [f"/repos/user/project_{index}" for index in range(8)]
+
+def test_repo_index_follows_pages_and_revalidates_cache(stub_server, client, tmp_path):
+    with patch('repo_index.get_client', return_value=client), \
+         patch('repo_index.get_async_client', return_value=AsyncGitHubClient(client, concurrency=4)) as get_async_client, \
+         patch('utils.get_setting', side_effect=lambda key, fallback=None, cast=str: str(tmp_path) if key == 'cache_dir' else fallback), \
+         patch('repo_index.get_setting', return_value=0):
+        index = build_repo_index("user", "dummy_token")
+        assert sorted(index) == sorted(f"project{page}_{index}" for page in range(1, 4) for index in range(2))
+        assert index['project3_1']['html_url'] == "https://github.com/user/Project3_1"
+        assert get_async_client.called
+
+        stub_server.requests.clear()
+        assert build_repo_index("user", "dummy_token") == index
+        # Pages after the first are requested together once the first names the last one
+        assert sorted(headers.get('If-None-Match') for _, headers in stub_server.requests) == ['"page1"', '"page2"', '"page3"']
+
+def test_repo_index_is_rebuilt_after_ttl():
+    indexes = [{'first': {}}, {'first': {}, 'second': {}}]
+    with patch('repo_index._indexes', {}), \
+         patch('repo_index.build_repo_index', side_effect=indexes) as build, \
+         patch('repo_index.get_setting', return_value=3600), \
+         patch('repo_index.time.monotonic', side_effect=[0, 10, 4000, 4000]):
+        assert get_repo_index("user", "dummy_token") == indexes[0]
+        assert get_repo_index("user", "dummy_token") == indexes[0]
+        assert get_repo_index("user", "dummy_token") == indexes[1]
+    assert build.call_count == 2
+
+@pytest.fixture
+def unreachable_github(tmp_path):
+    import requests
+    from unittest.mock import Mock
+    unreachable = Mock(url=lambda path: path)
+    unreachable.request.side_effect = requests.ConnectionError("connection refused")
+    with patch('utils.get_setting', side_effect=lambda key, fallback=None, cast=str: str(tmp_path) if key == 'cache_dir' else fallback), \
+         patch('repo_index.get_client', return_value=unreachable), \
+         patch('repo_index.get_setting', return_value=0):
+        yield
+
+def test_repo_index_falls_back_to_stale_cache_when_github_is_unreachable(unreachable_github):
+    from utils import write_json_cache
+    from repo_index import index_cache_name
+    pages = [{'url': 'page1', 'etag': '"page1"', 'next': None,
+              'repos': [{'name': 'Project', 'owner': 'user', 'html_url': 'https://github.com/user/Project'}]}]
+    write_json_cache(index_cache_name("dummy_token"), {'fetched_at': 0, 'pages': pages})
+    assert build_repo_index("user", "dummy_token") == {'project': pages[0]['repos'][0]}
+
+def test_plain_directory_is_left_alone_when_github_is_unreachable(unreachable_github, tmp_path):
+    from main import process_project
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "file.txt").write_text("local\n")
+
+    with patch('repo_index._indexes', {}) as indexes, pytest.raises(RuntimeError):
+        process_project(str(project), "user", "dummy_token", "")
+    # Nothing is kept, so the next lookup asks GitHub again instead of matching against an empty index
+    assert indexes == {}
+    assert os.listdir(project) == ["file.txt"]
@@ -0,0 +1,37 @@
+import sys
+import os
+import gzip
+import json
+import logging
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import log_setup
+
+def make_record(message):
+    record = logging.LogRecord('root', logging.INFO, __file__, 1, message, None, None)
+    log_setup.ProjectContextFilter().filter(record)
+    return record
+
+def test_rotated_logs_are_compressed_and_expired(tmp_path):
+    handler = log_setup.CompressingRotatingFileHandler(str(tmp_path / "autosave.log"), max_bytes=200, keep_files=2)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    for index in range(5):
+        handler.emit(make_record(f"{index}" * 150))
+    handler.close()
+
+    rotated = handler.rotated_files()
+    assert len(rotated) == 2
+    with gzip.open(rotated[-1], 'rt') as f:
+        assert f.read() == "3" * 150 + "\n"
+    assert (tmp_path / "autosave.log").read_text() == "4" * 150 + "\n"
+
+def test_json_lines_carry_the_project():
+    log_setup.set_project('demo')
+    try:
+        entry = json.loads(log_setup.JsonFormatter().format(make_record("Processing %s" % 'demo')))
+    finally:
+        log_setup.set_project('-')
+    assert entry['project'] == 'demo'
+    assert entry['message'] == "Processing demo"
+    assert entry['level'] == 'INFO'
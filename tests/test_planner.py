@@ -0,0 +1,61 @@
+import sys
+import os
+import time
+from git import Repo
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import state
+import planner
+import git_operations
+
+ACCOUNT = {'name': 'default', 'username': 'dummy_user', 'token': 'dummy_token'}
+
+def tree_snapshot(path):
+    return sorted((os.path.join(root, name), os.stat(os.path.join(root, name)).st_mtime_ns)
+                  for root, _, names in os.walk(path) for name in names)
+
+def test_plan_sweep_is_read_only_and_costs_each_action(tmp_path, project):
+    matched, _ = project
+    # Pretend origin is on GitHub, as an earlier run recorded it
+    matched.git.remote('set-url', 'origin', 'https://github.com/dummy_user/matched.git')
+    state.save_project(matched.working_dir, classification='matched', **git_operations.describe_repo(matched.working_dir))
+    unsaved = tmp_path / "project" / "notes.txt"
+    unsaved.write_text("x" * 1000)
+    old = time.time() - 3 * 86400
+    os.utime(unsaved, (old, old))
+
+    local_only = Repo.init(tmp_path / "projects" / "local_only", initial_branch='main')
+    (tmp_path / "projects" / "local_only" / "file.txt").write_text("two\n")
+    local_only.git.add(A=True)
+    local_only.git.commit('-m', 'initial')
+    (tmp_path / "projects" / "plain").mkdir()
+    (tmp_path / "projects" / "plain" / "readme.md").write_text("three\n")
+
+    paths = [matched.working_dir] + [str(tmp_path / "projects" / name) for name in ('local_only', 'plain', 'missing')]
+    before = tree_snapshot(tmp_path)
+    plan = planner.plan_sweep(paths, lambda path: ACCOUNT, jobs=2)
+
+    assert tree_snapshot(tmp_path) == before
+    assert 'GIT_OPTIONAL_LOCKS' not in os.environ
+    entries = {entry['project']: entry for entry in plan['projects']}
+    assert entries['project']['action'] == 'matched' and entries['project']['reason'] == 'recorded match'
+    assert entries['project']['autosave'] and entries['project']['github_api_calls'] == 0
+    assert entries['project']['push_bytes'] >= 1000
+    assert entries['local_only']['action'] == 'create_remote' and entries['local_only']['push_bytes'] > 0
+    assert entries['plain']['action'] == 'create' and entries['plain']['files_changed'] == 1
+    assert entries['missing']['action'] == 'skip'
+    assert plan['totals']['autosaves'] == 1
+    # The repository index was never cached, so listing it is part of the cost
+    assert plan['totals']['github_api_calls'] == 1 + 1 + 1
+    assert 'matched' in planner.format_table(plan)
+
+def test_plan_sweep_does_not_create_state_or_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr('state.get_db_path', lambda: str(tmp_path / 'cache' / 'state.db'))
+    monkeypatch.setattr('utils.get_setting', lambda key, fallback=None, cast=str: str(tmp_path / 'cache') if key == 'cache_dir' else fallback)
+    Repo.init(tmp_path / "project")
+
+    plan = planner.plan_sweep([str(tmp_path / "project")], lambda path: ACCOUNT)
+
+    assert plan['projects'][0]['action'] == 'create_remote'
+    assert not (tmp_path / 'cache').exists()
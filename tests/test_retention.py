@@ -0,0 +1,33 @@
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import retention
+from conftest import settings
+
+def test_expired_autosave_branches_by_age_and_count():
+    names = ['main_20240101_autosave_0', 'main_20240110_autosave_0', 'main_20240110_autosave_0_1',
+             'main_20240110_autosave_0_2', 'feature_20240101_autosave_0']
+    branches = {name: dict(zip(('branch', 'date', 'increment'), retention.parse_autosave_branch(name))) for name in names}
+    now = datetime.datetime(2024, 1, 11)
+
+    assert sorted(retention.expired_autosave_branches(branches, now, keep_days=7)) == ['feature_20240101_autosave_0', 'main_20240101_autosave_0']
+    assert sorted(retention.expired_autosave_branches(branches, now, keep_count=2)) == ['main_20240101_autosave_0', 'main_20240110_autosave_0']
+    assert retention.parse_autosave_branch('main') is None
+
+def test_prune_deletes_local_and_remote_branches(project):
+    repo, remote = project
+    old, new = 'main_20240101_autosave_0', 'main_20240110_autosave_0'
+    for name in (old, new):
+        repo.git.branch(name)
+    repo.git.push('origin', old, new)
+
+    with patch('retention.get_setting', side_effect=settings(autosave_keep_days=7)):
+        assert retention.prune_autosave_branches(repo, datetime.datetime(2024, 1, 11)) == [old]
+
+    assert remote.git.for_each_ref('--format=%(refname:short)', 'refs/heads').split() == ['main', new]
+    assert old not in repo.git.branch('--list').split()
+    assert new in repo.git.branch('--list').split()
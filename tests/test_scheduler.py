@@ -0,0 +1,47 @@
+import sys
+import os
+import time
+import datetime
+from unittest.mock import patch
+from git import Repo
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import state
+from main import run_projects
+from scheduler import prioritize, record_carryover
+
+def make_repo(path, unsaved_age_hours=None):
+    Repo.init(path)
+    if unsaved_age_hours is not None:
+        change = os.path.join(path, "unsaved.txt")
+        with open(change, "w") as f:
+            f.write("unsaved\n")
+        timestamp = time.time() - unsaved_age_hours * 3600
+        os.utime(change, (timestamp, timestamp))
+    return str(path)
+
+def test_prioritize_orders_by_carryover_then_urgency(tmp_path):
+    clean = make_repo(tmp_path / "clean")
+    recent = make_repo(tmp_path / "recent", unsaved_age_hours=1)
+    stale = make_repo(tmp_path / "stale", unsaved_age_hours=48)
+    carried = make_repo(tmp_path / "carried")
+    plain = tmp_path / "plain"
+    plain.mkdir()
+    state.save_project(carried, carryover=1)
+
+    for jobs in (1, 4):
+        assert prioritize([clean, recent, stale, str(plain), carried], datetime.datetime.now(), jobs) == [carried, str(plain), stale, recent, clean]
+
+def test_projects_past_the_deadline_are_deferred_and_carried_over(tmp_path):
+    first = make_repo(tmp_path / "first")
+    second = make_repo(tmp_path / "second")
+
+    with patch('main.process_project', side_effect=lambda *args: time.sleep(0.2)):
+        results = run_projects([first, second], "dummy_user", "dummy_token", "dummy_key", deadline=time.monotonic() + 0.1)
+    record_carryover(results)
+
+    assert results[first]['status'] == 'ok'
+    assert results[second]['status'] == 'deferred'
+    assert state.load_project(second)['carryover'] == 1
+    assert prioritize([first, second])[0] == second
@@ -0,0 +1,28 @@
+import sys
+import os
+import time
+from unittest.mock import patch
+from git import Repo
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import throttle
+from conftest import settings
+
+def test_busy_reason_reports_recent_edits(tmp_path):
+    repo = Repo.init(tmp_path / "project")
+    path = tmp_path / "project" / "editing.txt"
+    path.write_text("draft\n")
+    with patch('throttle.get_setting', side_effect=settings(busy_recent_seconds=60)):
+        assert 'modified' in throttle.busy_reason(repo)
+        old = time.time() - 3600
+        os.utime(path, (old, old))
+        assert throttle.busy_reason(repo) is None
+
+def test_wait_until_idle_gives_up_after_max_wait(tmp_path):
+    repo = Repo.init(tmp_path / "project")
+    (tmp_path / "project" / "editing.txt").write_text("draft\n")
+    with patch('throttle.get_setting', side_effect=settings(busy_recent_seconds=60, busy_backoff_seconds=0.05, busy_max_wait=0.2)):
+        start = time.monotonic()
+        throttle.wait_until_idle(repo)
+    assert 0.1 <= time.monotonic() - start < 5
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import shutil
+import logging
+import datetime
+import threading
+import subprocess
+from git import Git, Repo
+
+import metrics
+from utils import get_setting
+from change_detection import scan_changes
+
+IONICE_CLASSES = {'realtime': '1', 'best-effort': '2', 'idle': '3'}
+
+# Limits the number of git subprocesses running at once across all worker threads
+_git_slots = None
+
+# time.monotonic() deadline of the project handled by the current thread, past which git commands are killed
+_deadline = threading.local()
+
+# Commands started after the deadline, such as restoring the branch and the stash, still get this long
+CLEANUP_SECONDS = 60
+
+class DeadlineExceeded(Exception):
+    """Raised instead of starting a step with side effects once the project has timed out."""
+
+class ThrottledGit(Git):
+    """Git command wrapper that waits for a free slot before starting a git subprocess and kills it at the project deadline."""
+    def execute(self, command, *args, **kwargs):
+        timeout = git_timeout()
+        if timeout is not None and not kwargs.get('as_process'):
+            kwargs.setdefault('kill_after_timeout', timeout)
+        # Streaming commands hand the live process to the caller, so they cannot hold a slot
+        if _git_slots is None or kwargs.get('as_process'):
+            return super().execute(command, *args, **kwargs)
+        with _git_slots:
+            return super().execute(command, *args, **kwargs)
+
+def install():
+    """Apply the configured resource limits to this process and every git command it runs."""
+    global _git_slots
+    apply_process_priority()
+    Repo.GitCommandWrapperType = ThrottledGit
+    max_processes = get_setting('git_max_processes', 0, int)
+    if max_processes > 0:
+        _git_slots = threading.BoundedSemaphore(max_processes)
+        logging.info("Running at most %s git processes at once.", max_processes)
+
+def set_deadline(deadline):
+    """Kill git commands of the current thread that run past deadline (a time.monotonic() value), or None for no limit."""
+    _deadline.value = deadline
+
+def git_timeout():
+    """Return the seconds a git command started now may run for, or None if it is not limited.
+
+    A killed command raises GitCommandError, so the caller unwinds through its cleanup. GitPython
+    cannot kill commands on Windows, where they are not limited.
+    """
+    deadline = getattr(_deadline, 'value', None)
+    if deadline is None or sys.platform == 'win32':
+        return None
+    remaining = deadline - time.monotonic()
+    return remaining if remaining > 0 else CLEANUP_SECONDS
+
+def check_deadline(action):
+    """Raise DeadlineExceeded if the project handled by the current thread is past its deadline.
+
+    Called before creating, renaming or pushing anything, so a worker abandoned by run_projects
+    only restores the branch and the stash on its way out. Applies on Windows too.
+    """
+    deadline = getattr(_deadline, 'value', None)
+    if deadline is not None and time.monotonic() > deadline:
+        raise DeadlineExceeded(f"Project timed out, not {action}")
+
+def apply_process_priority():
+    """Lower the CPU and I/O priority of this process, which the git subprocesses inherit."""
+    nice = get_setting('git_nice', 0, int)
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)
+        logging.info("Running with nice %s.", nice)
+    ionice_class = get_setting('git_ionice_class')
+    if ionice_class:
+        if not shutil.which('ionice'):
+            logging.warning("git_ionice_class is set but ionice is not installed, ignoring it.")
+            return
+        result = subprocess.run(['ionice', '-c', IONICE_CLASSES.get(ionice_class, ionice_class), '-p', str(os.getpid())],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            logging.warning("Failed to set I/O priority class %s: %s", ionice_class, result.stderr.strip())
+        else:
+            logging.info("Running with I/O priority class %s.", ionice_class)
+
+def limit_upload(command):
+    """Wrap a command so its upload bandwidth stays under push_max_kbps, if configured.
+
+    git has no bandwidth limit of its own; trickle limits the process and the transport
+    helpers it starts. Returns None when no limit applies.
+    """
+    max_kbps = get_setting('push_max_kbps', 0, int)
+    if max_kbps <= 0:
+        return None
+    if not shutil.which('trickle'):
+        logging.warning("push_max_kbps is set but trickle is not installed, pushing without a bandwidth limit.")
+        return None
+    return ['trickle', '-s', '-u', str(max_kbps)] + command
+
+def busy_reason(repo, now=None):
+    """Return why the machine or the user look busy, or None if autosaving can go ahead."""
+    max_load = get_setting('busy_load_per_cpu', 0, float)
+    if max_load > 0 and hasattr(os, 'getloadavg'):
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        if load > max_load:
+            return f"load average {load:.2f} per CPU is above {max_load}"
+    recent_seconds = get_setting('busy_recent_seconds', 0, float)
+    if recent_seconds > 0:
+        now = now or datetime.datetime.now()
+        recent = datetime.timedelta(seconds=recent_seconds)
+        if any(now - change['modified'] < recent for change in scan_changes(repo)):
+            return f"files were modified in the last {recent_seconds:g} seconds"
+    return None
+
+def wait_until_idle(repo):
+    """Back off while the system or the project is busy, for at most busy_max_wait seconds."""
+    backoff = get_setting('busy_backoff_seconds', 30, float)
+    deadline = time.monotonic() + get_setting('busy_max_wait', 600, float)
+    with metrics.span('throttle'):
+        while True:
+            reason = busy_reason(repo)
+            if reason is None:
+                return
+            if time.monotonic() + backoff > deadline:
+                logging.info("Still busy (%s), autosaving %s anyway.", reason, repo.working_dir)
+                return
+            logging.info("Postponing autosave of %s: %s.", repo.working_dir, reason)
+            time.sleep(backoff)
@@ -1,8 +1,8 @@
 import configparser
 import os
+import json
 import logging
-import datetime
-from openai import OpenAI
+import tempfile
 
 def load_config():
     """Load configuration from the config file specified in the environment variable."""
@@ -14,19 +14,52 @@ def load_config():
     config.read(config_file)
     return config['DEFAULT']
 
-def generate_ai_message(changes, openai_key):
-    """Generate a commit message using OpenAI based on the changes."""
-    client = OpenAI(api_key=openai_key)
-    prompt = f"Generate a concise commit message for the following changes:\n{changes}"
+_config = None
+
+def get_setting(key, fallback=None, cast=str):
+    """Read an optional setting from the config file, returning fallback if it is unset or no config is available."""
+    global _config
+    if _config is None:
+        if not os.environ.get('GITHUB_AUTOSAVE_CONFIG_FILE'):
+            return fallback
+        _config = load_config()
+    value = _config.get(key)
+    if value is None or value.strip() == '':
+        return fallback
+    if cast is bool:
+        return configparser.ConfigParser.BOOLEAN_STATES.get(value.strip().lower(), fallback)
+    return cast(value.strip())
+
+def get_cache_dir(create=True):
+    """Return the directory used for on-disk caches, creating it if necessary unless create is False."""
+    cache_dir = get_setting('cache_dir') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+    if create:
+        os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def read_json_cache(name):
+    """Load a JSON cache file from the cache directory, returning None if it is missing or unreadable."""
+    return read_json_file(os.path.join(get_cache_dir(create=False), name))
+
+def read_json_file(path):
+    """Load a JSON file, returning None if it is missing or unreadable."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json_cache(name, data):
+    """Atomically replace a JSON cache file in the cache directory."""
+    write_json_atomic(os.path.join(get_cache_dir(), name), data)
+
+def write_json_atomic(path, data):
+    """Write JSON to a temporary file next to path and rename it into place, so readers never see a partial file."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_')
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are one of the best coding mentors in the world."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        logging.error(f"Failed to generate AI message: {e}")
-        return f"Autosave commit at {datetime.datetime.now()}"
\ No newline at end of file
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise